@@ -1,5 +1,6 @@
 import streamlit as st
 from nlp_humanizer import NLPHumanizer
+from humanizer_incremental import IncrementalHumanizer
 import streamlit.components.v1 as components
 import json
 
@@ -67,11 +68,16 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Logic Initialization
+# One humanizer (compiled rules + loaded NLTK models) per server process, shared by every rerun and session
+@st.cache_resource
 def get_humanizer():
-    return NLPHumanizer()
+    return NLPHumanizer().warmup()
 
 humanizer = get_humanizer()
 
+# Output characters per page of the highlighted view; only the visible page is sent to the browser
+PAGE_CHARS = 20000
+
 # Initialize Session State
 if "ai_input" not in st.session_state:
     st.session_state.ai_input = ""
@@ -79,8 +85,12 @@ if "human_output" not in st.session_state:
     st.session_state.human_output = ""
 if "human_output_editable" not in st.session_state:
     st.session_state.human_output_editable = ""
-if "human_output_highlighted" not in st.session_state:
-    st.session_state.human_output_highlighted = ""
+if "output_page" not in st.session_state:
+    st.session_state.output_page = 1
+# Remembers the last run per line so edits only re-humanize the lines that changed
+if "incremental" not in st.session_state:
+    # The .humanized-highlight CSS above styles the spans, so they need no inline style
+    st.session_state.incremental = IncrementalHumanizer(humanizer, inline_style=False)
 
 # --- Humanize Logic Callback ---
 def run_humanization():
@@ -91,7 +101,8 @@ def run_humanization():
             m_synonym_freq = st.session_state.get("synonym_freq_key", 0.1)
             m_clean_mode = st.session_state.get("clean_mode_key", True)
             
-            result = humanizer.humanize(
+            # Only lines changed since the last run are humanized (and re-diffed) again
+            result, _ = st.session_state.incremental.update(
                 input_text,
                 messiness=0.1,
                 synonym_freq=m_synonym_freq,
@@ -100,8 +111,8 @@ def run_humanization():
             st.session_state.human_output = result
             # Set the keyed widget value BEFORE it is rendered
             st.session_state.human_output_editable = result
-            # Generate highlighted version
-            st.session_state.human_output_highlighted = humanizer.get_highlighted_diff(input_text, result)
+            # The highlighted version is kept per line by the incremental humanizer and rendered a page at a time
+            st.session_state.output_page = 1
             st.session_state.success_toast = True
         except Exception as e:
             st.session_state.error_msg = str(e)
@@ -153,6 +164,8 @@ with col1:
             st.session_state.ai_input = ""
             st.session_state.human_output = ""
             st.session_state.human_output_editable = ""
+            st.session_state.output_page = 1
+            st.session_state.incremental.reset()
             st.rerun()
 
     st.text_area(
@@ -196,9 +209,14 @@ with col2:
         st.button("📋 Copy to Clipboard", disabled=True, use_container_width=True)
 
     if st.session_state.human_output:
+        incremental = st.session_state.incremental
+        page_count = len(incremental.pages(PAGE_CHARS))
+        if page_count > 1:
+            st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, key="output_page")
+        highlighted = incremental.highlighted_page(st.session_state.output_page - 1, PAGE_CHARS) if page_count else ""
         st.markdown(f"""
             <div class="output-container">
-                {st.session_state.human_output_highlighted or st.session_state.human_output}
+                {highlighted or st.session_state.human_output}
             </div>
         """, unsafe_allow_html=True)
     else:
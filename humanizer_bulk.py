@@ -0,0 +1,136 @@
+import json
+import os
+from collections import deque
+
+
+def humanize_records(humanizer, records, options, field, output_field, workers=1):
+    """
+    Yield records with `output_field` set.
+
+    Records that are not objects, or have no string `field`, pass through unchanged.
+    """
+    def text(record):
+        value = record.get(field) if isinstance(record, dict) else None
+        return value if isinstance(value, str) else None
+
+    if not workers or workers <= 1:
+        for record in records:
+            value = text(record)
+            if value is not None:
+                record[output_field] = humanizer.humanize(value, **options)
+            yield record
+        return
+
+    # multiprocessing is only imported once parallel mode is actually used
+    from humanizer_parallel import ordered_passthrough
+    pool = humanizer._get_pool(workers)
+    # Seeded records are looked up in the result cache here; only the misses go to the pool
+    lookup, store = humanizer._cache_hooks(**options)
+    for record, humanized in ordered_passthrough(pool, workers, records, text, options, chunk_size=16,
+                                                 lookup=lookup, store=store):
+        if humanized is not None:
+            record[output_field] = humanized
+        yield record
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def job_identity(input_path, field, output_field, options):
+    """Describe a JSONL job so a checkpoint is only resumed against the same input and settings."""
+    stat = os.stat(input_path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+        "field": field,
+        "output_field": output_field,
+        # Round-trip through JSON so the comparison matches what was loaded from disk
+        "options": json.loads(json.dumps(options, sort_keys=True)),
+    }
+
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run_jsonl_job(humanizer, input_path, output_path, field="text", output_field=None, options=None,
+                  workers=1, checkpoint_path=None, checkpoint_every=1000):
+    """
+    Humanize one field of every record of a JSONL file into a sibling field, resumably.
+
+    Every `checkpoint_every` records the output is flushed to disk and the
+    byte offsets reached in the input and output are recorded in
+    `checkpoint_path` (default: `<output_path>.checkpoint`). Re-running the
+    same job after a crash truncates the output back to the last checkpoint
+    and continues reading the input from the matching offset. A checkpoint
+    left by a different input file state, field or options is discarded and
+    the job starts over; the checkpoint is removed once the job finishes.
+    Returns the number of records written by this run.
+    """
+    options = options or {}
+    output_field = output_field or f"{field}_humanized"
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+
+    job = job_identity(input_path, field, output_field, options)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None and os.path.abspath(checkpoint["input"]) != os.path.abspath(input_path):
+        raise ValueError(f"{checkpoint_path} belongs to a job reading {checkpoint['input']}, not {input_path}")
+    # The input changed or the job settings differ: the recorded offsets mean nothing, start over
+    if checkpoint is not None and (checkpoint.get("job") != job or not os.path.exists(output_path)):
+        checkpoint = None
+    if checkpoint is None:
+        checkpoint = {"input": input_path, "job": job, "input_offset": 0, "output_offset": 0, "records": 0}
+
+    # Input offset just past each record that has been read but not yet written
+    offsets = deque()
+
+    def read_records(in_f):
+        while True:
+            line = in_f.readline()
+            if not line:
+                return
+            if not line.strip():
+                # Blank lines produce no record; fold them into the previous record's offset
+                if offsets:
+                    offsets[-1] = in_f.tell()
+                else:
+                    checkpoint["input_offset"] = in_f.tell()
+                continue
+            offsets.append(in_f.tell())
+            yield json.loads(line)
+
+    written = 0
+    with open(input_path, "rb") as in_f, open(output_path, "r+b" if checkpoint["output_offset"] else "wb") as out_f:
+        in_f.seek(checkpoint["input_offset"])
+        out_f.truncate(checkpoint["output_offset"])
+        out_f.seek(checkpoint["output_offset"])
+
+        for record in humanize_records(humanizer, read_records(in_f), options, field, output_field, workers):
+            out_f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            checkpoint["input_offset"] = offsets.popleft()
+            checkpoint["records"] += 1
+            written += 1
+            if written % checkpoint_every == 0:
+                out_f.flush()
+                os.fsync(out_f.fileno())
+                checkpoint["output_offset"] = out_f.tell()
+                save_checkpoint(checkpoint_path, checkpoint)
+
+        out_f.flush()
+        os.fsync(out_f.fileno())
+
+    # The whole input is written; a re-run should start fresh rather than resume at the end
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return written
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(paragraph, messiness, synonym_freq, clean_mode, seed, rules_version):
+    """Content address of one humanized paragraph."""
+    payload = json.dumps([paragraph, messiness, synonym_freq, clean_mode, seed, rules_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_size(key, value):
+    return len(key) + len(value.encode("utf-8"))
+
+
+class MemoryResultCache:
+    """In-process LRU of humanized paragraphs, evicted once `max_bytes` is exceeded."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= _entry_size(key, old)
+            self._data[key] = value
+            self.size += _entry_size(key, value)
+            while self.size > self.max_bytes and self._data:
+                old_key, old_value = self._data.popitem(last=False)
+                self.size -= _entry_size(old_key, old_value)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteResultCache:
+    """
+    On-disk result cache that several processes can share through the same file.
+
+    The total stored size is kept in the database and updated in the same
+    transaction as every insert, so `max_bytes` bounds the file however many
+    processes write to it. Entries carry a last-used timestamp; once the total
+    exceeds `max_bytes` the least recently used rows are deleted. Hits only
+    note their timestamp in memory and write them in batches (every
+    `touch_every` hits, on each put and on close), so a hit costs one SELECT.
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, touch_every=256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_every = touch_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last-used time not yet written
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode: writes run in explicit BEGIN IMMEDIATE transactions below
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock:
+            self._write(self._create_tables)
+
+    def _create_tables(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM results")
+
+    def _write(self, func, *args):
+        """Run func(conn, *args) in one write transaction (callers hold self._lock)."""
+        conn = self._conn
+        # IMMEDIATE takes the write lock up front, so concurrent processes serialize instead of deadlocking
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _write_touched(self, conn):
+        if self._touched:
+            conn.executemany("UPDATE results SET used = ? WHERE key = ?",
+                             [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_every:
+                self._write(self._write_touched)
+            return row[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._write(self._put, key, value)
+
+    def _put(self, conn, key, value):
+        self._write_touched(conn)
+        size = _entry_size(key, value)
+        old = conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+        conn.execute("INSERT OR REPLACE INTO results (key, value, size, used) VALUES (?, ?, ?, ?)",
+                     (key, value, size, time.time()))
+        total = conn.execute("SELECT size FROM meta WHERE id = 0").fetchone()[0] + size - (old[0] if old else 0)
+        while total > self.max_bytes:
+            victim = conn.execute("SELECT key, size FROM results ORDER BY used LIMIT 1").fetchone()
+            if victim is None:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (victim[0],))
+            total -= victim[1]
+        conn.execute("UPDATE meta SET size = ? WHERE id = 0", (total,))
+
+    @property
+    def size(self):
+        """Bytes stored in the file, across every process using it."""
+        with self._lock:
+            return self._conn.execute("SELECT size FROM meta WHERE id = 0").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._write(self._write_touched)
+            self._conn.close()
@@ -0,0 +1,150 @@
+"""
+Command-line batch entry point.
+
+    python -m nlp_humanizer notes.txt -o notes.human.txt
+    cat draft.txt | python -m nlp_humanizer --seed 7 > draft.human.txt
+    python -m nlp_humanizer docs/ -o out/ --workers 8
+    python -m nlp_humanizer records.jsonl --jsonl --field body --workers 8 -o out.jsonl
+
+JSONL written to a file is checkpointed (<output>.checkpoint); re-running the
+same command after a crash resumes from the last checkpoint.
+"""
+import argparse
+import json
+import os
+import sys
+
+from humanizer_cache import SQLiteResultCache
+from nlp_humanizer import NLPHumanizer, download_nltk_resources
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nlp_humanizer", description="Humanize AI-generated text in bulk.")
+    parser.add_argument("inputs", nargs="*", default=["-"],
+                        help="Files or directories to read ('-' or nothing for stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Output file, or output directory when an input is a directory (default: stdout)")
+    parser.add_argument("--messiness", type=float, default=0.3)
+    parser.add_argument("--synonym-freq", type=float, default=0.3)
+    parser.add_argument("--no-clean", dest="clean_mode", action="store_false",
+                        help="Allow informal contractions, slang and imperfections")
+    parser.add_argument("--seed", type=int, default=None, help="Make the output reproducible")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--jsonl", action="store_true", help="Inputs are JSON Lines; humanize one field per record")
+    parser.add_argument("--field", default="text", help="JSONL field to humanize (default: text)")
+    parser.add_argument("--output-field", default=None,
+                        help="JSONL field to write the result to (default: <field>_humanized)")
+    parser.add_argument("--checkpoint-every", type=int, default=1000,
+                        help="JSONL records between checkpoints when writing to a file (default: 1000)")
+    parser.add_argument("--synonym-table", default=None, help="Precomputed synonym table to use instead of WordNet")
+    parser.add_argument("--cache", default=None, help="SQLite file for caching seeded paragraph results")
+    parser.add_argument("--offline", action="store_true",
+                        help="Fail immediately if NLTK data is missing instead of downloading it")
+    parser.add_argument("--preload", action="store_true",
+                        help="Load NLTK models once before forking workers so they share the memory")
+    parser.add_argument("--report-memory", action="store_true",
+                        help="Print the RSS of each worker process to stderr when done")
+    return parser
+
+
+def _open_input(path):
+    if path == "-":
+        return sys.stdin
+    # newline="" keeps '\r\n' and friends exactly as they are in the file
+    return open(path, encoding="utf-8", newline="")
+
+
+def _open_output(path):
+    if path == "-":
+        return sys.stdout
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def humanize_text_stream(humanizer, in_f, out_f, options, workers=1):
+    for line in humanizer.humanize_stream(in_f, workers=workers, **options):
+        out_f.write(line)
+
+
+def humanize_jsonl(humanizer, in_f, out_f, options, field, output_field, workers=1):
+    """Humanize `field` of every JSONL record into `output_field`, streaming in order."""
+    from humanizer_bulk import humanize_records
+    records = (json.loads(line) for line in in_f if line.strip())
+    for record in humanize_records(humanizer, records, options, field, output_field, workers):
+        out_f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _iter_jobs(inputs, output):
+    """(input path, output path) pairs; directories are walked and mirrored under `output`."""
+    for path in inputs:
+        if path != "-" and os.path.isdir(path):
+            if output == "-":
+                raise SystemExit(f"{path} is a directory: --output must name an output directory")
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    source = os.path.join(root, name)
+                    yield source, os.path.join(output, os.path.relpath(source, path))
+        else:
+            yield path, None
+
+
+def _megabytes(size):
+    return "?" if size is None else f"{size / (1024 * 1024):.1f}MB"
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = dict(messiness=args.messiness, synonym_freq=args.synonym_freq,
+                   clean_mode=args.clean_mode, seed=args.seed)
+    output_field = args.output_field or f"{args.field}_humanized"
+    if args.offline:
+        download_nltk_resources(offline=True)
+
+    result_cache = SQLiteResultCache(args.cache) if args.cache else None
+    humanizer = NLPHumanizer(synonym_table=args.synonym_table, result_cache=result_cache, preload=args.preload)
+
+    shared_out = None
+    try:
+        for source, target in _iter_jobs(args.inputs, args.output):
+            # File-to-file JSONL jobs run resumably, checkpointing byte offsets as they go
+            # (only when each input gets its own output file)
+            own_output = target is not None or (args.output != "-" and len(args.inputs) == 1)
+            if args.jsonl and source != "-" and own_output:
+                from humanizer_bulk import run_jsonl_job
+                run_jsonl_job(humanizer, source, target or args.output, args.field, output_field, options,
+                              args.workers, checkpoint_every=args.checkpoint_every)
+                continue
+            if target is None:
+                shared_out = shared_out or _open_output(args.output)
+                out_f = shared_out
+            else:
+                out_f = _open_output(target)
+            in_f = _open_input(source)
+            try:
+                if args.jsonl:
+                    humanize_jsonl(humanizer, in_f, out_f, options, args.field, output_field, args.workers)
+                else:
+                    humanize_text_stream(humanizer, in_f, out_f, options, args.workers)
+            finally:
+                if in_f is not sys.stdin:
+                    in_f.close()
+                if out_f is not shared_out:
+                    out_f.close()
+        if args.report_memory:
+            for usage in humanizer.worker_memory():
+                print(f"worker {usage['pid']}: rss={_megabytes(usage['rss'])} shared={_megabytes(usage['shared'])} "
+                      f"private={_megabytes(usage['private'])}", file=sys.stderr)
+    finally:
+        if shared_out is not None and shared_out is not sys.stdout:
+            shared_out.close()
+        humanizer.close()
+        if result_cache is not None:
+            result_cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
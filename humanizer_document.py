@@ -0,0 +1,447 @@
+import re
+from array import array
+from collections import Counter, namedtuple
+
+# NLTK is imported inside the functions that need it: importing it is slow,
+# and nothing here runs until text is actually processed
+
+# word_tokenize rewrites straight double quotes into these Treebank forms
+_QUOTE_TOKENS = {"``": '"', "''": '"'}
+
+# Words, single punctuation marks and whitespace runs (together they cover every character)
+DIFF_TOKEN = re.compile(r'\w+|[^\w\s]|\s+')
+
+# Origin of a piece of sentence text that was written by the pipeline
+NEW = -1
+
+# The POS tagger, loaded once per process on first use (see get_tagger)
+_tagger = None
+
+
+def get_tagger():
+    """
+    The process-wide averaged perceptron tagger.
+
+    Loading it unpickles the whole model, so it is done once and every
+    tagging call goes straight to `tag`/`tag_sents` instead of through
+    `nltk.pos_tag`'s per-call tagger lookup and argument checks.
+    """
+    global _tagger
+    if _tagger is None:
+        from nltk.tag.perceptron import PerceptronTagger
+        _tagger = PerceptronTagger()
+    return _tagger
+
+# One recorded edit: original[start:end] was replaced by `text` in `stage`, by rule `rule`
+Edit = namedtuple("Edit", "start end text stage rule")
+
+
+class EditLog:
+    """
+    Provenance of every edit made to a Document, in original-text offsets.
+
+    Offsets, stage and rule are kept in parallel arrays (stage and rule
+    names are interned), so logging costs a few integer appends per edit.
+    Stages set `stage` before editing; rules are given per edit.
+    """
+
+    def __init__(self):
+        self.stage = None
+        self._starts = array("q")
+        self._ends = array("q")
+        self._stage_ids = array("l")
+        self._rule_ids = array("l")
+        self._texts = []
+        self._names = []
+        self._name_ids = {}
+
+    def _intern(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        return name_id
+
+    def add(self, start, end, text, rule=None, stage=None):
+        self._starts.append(start)
+        self._ends.append(end)
+        self._texts.append(text)
+        self._stage_ids.append(self._intern(stage or self.stage))
+        self._rule_ids.append(self._intern(rule))
+
+    def extend(self, other, offset=0):
+        """Append the records of `other`, shifting its offsets by `offset`."""
+        for edit in other:
+            self.add(edit.start + offset if edit.start >= 0 else edit.start,
+                     edit.end + offset if edit.end >= 0 else edit.end, edit.text, edit.rule, edit.stage)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __getitem__(self, index):
+        names = self._names
+        return Edit(self._starts[index], self._ends[index], self._texts[index],
+                    names[self._stage_ids[index]], names[self._rule_ids[index]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def counts(self):
+        """Number of edits per (stage, rule), e.g. for profiling which rules fire."""
+        names = self._names
+        return Counter((names[stage_id], names[rule_id]) for stage_id, rule_id in zip(self._stage_ids, self._rule_ids))
+
+    def __repr__(self):
+        return f"EditLog({list(self)!r})"
+
+
+class Token:
+    """A word token with its character offsets inside the owning sentence."""
+
+    __slots__ = ("text", "start", "end", "tag")
+
+    def __init__(self, text, start, end, tag=None):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.tag = tag
+
+    def __repr__(self):
+        return f"Token({self.text!r}, {self.start}, {self.end}, {self.tag!r})"
+
+
+def _align_tokens(text, words):
+    """Attach character offsets to word_tokenize output (-1 when not found)."""
+    tokens = []
+    pos = 0
+    for word in words:
+        start = text.find(word, pos)
+        if word in _QUOTE_TOKENS:
+            alt = text.find(_QUOTE_TOKENS[word], pos)
+            if alt != -1 and (start == -1 or alt < start):
+                start, word_len = alt, 1
+            else:
+                word_len = len(word)
+        else:
+            word_len = len(word)
+        if start == -1:
+            tokens.append(Token(word, -1, -1))
+            continue
+        end = start + word_len
+        tokens.append(Token(word, start, end))
+        pos = end
+    return tokens
+
+
+def _append_piece(pieces, length, origin):
+    if not length:
+        return
+    if pieces:
+        last_length, last_origin = pieces[-1]
+        # Merge with the previous piece when it continues it (new text, or the next original offsets)
+        if (origin == NEW and last_origin == NEW) or (origin != NEW and last_origin != NEW
+                                                      and last_origin + last_length == origin):
+            pieces[-1] = (last_length + length, last_origin)
+            return
+    pieces.append((length, origin))
+
+
+def _slice_pieces(pieces, start, end):
+    """The pieces covering text[start:end], with original offsets adjusted to the cut."""
+    result = []
+    pos = 0
+    for length, origin in pieces:
+        piece_end = pos + length
+        if piece_end > start and pos < end:
+            cut_start, cut_end = max(pos, start), min(piece_end, end)
+            _append_piece(result, cut_end - cut_start, origin if origin == NEW else origin + cut_start - pos)
+        if piece_end >= end:
+            break
+        pos = piece_end
+    return result
+
+
+def _original_span(pieces, start, end):
+    """
+    Offsets in the original paragraph of text[start:end].
+
+    Text written by the pipeline has no original offsets; an edit touching
+    only such text is placed (as an empty span) right after the original text
+    before it, and (-1, -1) if the sentence has no original text at all.
+    """
+    first = last = None
+    before = after = None
+    pos = 0
+    for length, origin in pieces:
+        piece_end = pos + length
+        if origin != NEW:
+            if piece_end > start and pos < end:
+                if first is None:
+                    first = origin + max(start, pos) - pos
+                last = origin + min(end, piece_end) - pos
+            elif piece_end <= start:
+                before = origin + length
+            elif after is None:
+                after = origin
+        pos = piece_end
+    if first is not None:
+        return first, last
+    anchor = before if before is not None else after
+    return (anchor, anchor) if anchor is not None else (-1, -1)
+
+
+def _text_edits(old, new):
+    """
+    (start, end, new_text) edits turning `old` into `new`.
+
+    The common prefix and suffix are trimmed (to word boundaries) first, so
+    only the rewritten middle of the sentence is diffed word by word.
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    # Don't cut through a word: back up to its start
+    if prefix and old[prefix - 1].isalnum() and (old[prefix:prefix + 1].isalnum() or new[prefix:prefix + 1].isalnum()):
+        while prefix and old[prefix - 1].isalnum():
+            prefix -= 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+    if suffix and old[old_end].isalnum() and (old[old_end - 1:old_end].isalnum() or new[new_end - 1:new_end].isalnum()):
+        while suffix and old[len(old) - suffix].isalnum():
+            suffix -= 1
+        old_end, new_end = len(old) - suffix, len(new) - suffix
+    old_mid, new_mid = old[prefix:old_end], new[prefix:new_end]
+    if not old_mid or not new_mid:
+        return [(prefix, old_end, new_mid)]
+
+    import difflib
+    old_tokens = DIFF_TOKEN.findall(old_mid)
+    new_tokens = DIFF_TOKEN.findall(new_mid)
+    old_offsets, new_offsets = [prefix], [0]
+    for token in old_tokens:
+        old_offsets.append(old_offsets[-1] + len(token))
+    for token in new_tokens:
+        new_offsets.append(new_offsets[-1] + len(token))
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    return [(old_offsets[i1], old_offsets[i2], new_mid[new_offsets[j1]:new_offsets[j2]])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+class Sentence:
+    """
+    One sentence of a Document; tokens and tags are computed lazily and cached.
+
+    The text is also kept as a piece table of (length, origin) runs, where
+    origin is the offset of the run in the original paragraph or NEW for text
+    the pipeline wrote, so the changed spans are known without diffing.
+    """
+
+    __slots__ = ("_text", "_tokens", "_tagged", "_pieces", "_log")
+
+    def __init__(self, text, origin=NEW, log=None):
+        self._text = text
+        self._tokens = None
+        self._tagged = False
+        self._pieces = [(len(text), origin)] if text else []
+        # The owning Document's EditLog, if any
+        self._log = log
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self.rewrite(value)
+
+    def rewrite(self, value, rule=None):
+        """Replace the whole text, logging the parts that actually changed under `rule`."""
+        if value != self._text:
+            # Whole-text rewrites are turned back into edits so the pieces stay exact
+            self.apply_edits(_text_edits(self._text, value), rule)
+
+    def _set(self, text, pieces):
+        self._text = text
+        self._pieces = pieces
+        self._tokens = None
+        self._tagged = False
+
+    def tokens(self):
+        if self._tokens is None:
+            import nltk
+            self._tokens = _align_tokens(self._text, nltk.word_tokenize(self._text))
+        return self._tokens
+
+    def tagged(self):
+        """Tokens with their `tag` filled in by the POS tagger."""
+        tokens = self.tokens()
+        if not self._tagged:
+            self.set_tags(tag for _, tag in get_tagger().tag([t.text for t in tokens]))
+        return tokens
+
+    def set_tags(self, tags):
+        for token, tag in zip(self.tokens(), tags):
+            token.tag = tag
+        self._tagged = True
+
+    def apply_edits(self, edits, rule=None):
+        """
+        Replace (start, end, new_text) spans, given in current offsets, in one pass.
+
+        An edit may carry its own rule id as a fourth item; otherwise `rule` is logged.
+        """
+        edits = [edit for edit in edits if self._text[edit[0]:edit[1]] != edit[2]]
+        if not edits:
+            return
+        parts = []
+        pieces = []
+        pos = 0
+        for edit in sorted(edits, key=lambda e: e[0]):
+            start, end, new_text = edit[:3]
+            if self._log is not None:
+                original_start, original_end = _original_span(self._pieces, start, end)
+                # Deleting text the pipeline wrote itself leaves nothing to record
+                if original_start != original_end or new_text:
+                    self._log.add(original_start, original_end, new_text, edit[3] if len(edit) > 3 else rule)
+            parts.append(self._text[pos:start])
+            parts.append(new_text)
+            for length, origin in _slice_pieces(self._pieces, pos, start):
+                _append_piece(pieces, length, origin)
+            _append_piece(pieces, len(new_text), NEW)
+            pos = end
+        parts.append(self._text[pos:])
+        for length, origin in _slice_pieces(self._pieces, pos, len(self._text)):
+            _append_piece(pieces, length, origin)
+        self._set("".join(parts), pieces)
+
+    def extend(self, other):
+        """Append the text of sentence `other`, keeping track of which parts of it are new."""
+        pieces = list(self._pieces)
+        for length, origin in other._pieces:
+            _append_piece(pieces, length, origin)
+        self._set(self._text + other._text, pieces)
+
+    def slice(self, start, end):
+        """A new Sentence holding text[start:end]."""
+        sentence = Sentence(self._text[start:end], log=self._log)
+        sentence._pieces = _slice_pieces(self._pieces, start, end)
+        return sentence
+
+    def original_span(self, start, end):
+        """Offsets in the original paragraph of text[start:end] (see _original_span)."""
+        return _original_span(self._pieces, start, end)
+
+    def changes(self):
+        """(start, end) spans of the current text written by the pipeline."""
+        spans = []
+        pos = 0
+        for length, origin in self._pieces:
+            if origin == NEW:
+                spans.append((pos, pos + length))
+            pos += length
+        return spans
+
+    def __repr__(self):
+        return f"Sentence({self._text!r})"
+
+
+class Document:
+    """
+    A paragraph segmented once into sentences and mutated in place by every stage.
+
+    Stages that may introduce a new sentence boundary (e.g. ", creating" ->
+    ". This makes") call `mark_split`; only those sentences are re-segmented,
+    and only when the sentence list is next read.
+    """
+
+    def __init__(self, text):
+        import nltk
+        self.edits = EditLog()
+        self._sentences = []
+        pos = 0
+        for sentence in (nltk.sent_tokenize(text) if text else []):
+            start = text.find(sentence, pos)
+            if start == -1:
+                self._sentences.append(Sentence(sentence, log=self.edits))
+                continue
+            self._sentences.append(Sentence(sentence, start, self.edits))
+            pos = start + len(sentence)
+        self._needs_split = set()
+
+    @property
+    def sentences(self):
+        if self._needs_split:
+            self._resegment()
+        return self._sentences
+
+    @sentences.setter
+    def sentences(self, value):
+        self._sentences = list(value)
+        self._needs_split = set()
+        for sent in self._sentences:
+            sent._log = self.edits
+
+    def new_sentence(self, text, after, rule=None):
+        """A Sentence written by the pipeline, logged as inserted after sentence `after`."""
+        _, anchor = after.original_span(len(after.text), len(after.text))
+        self.edits.add(anchor, anchor, text, rule)
+        return Sentence(text, log=self.edits)
+
+    def mark_split(self, sentence):
+        self._needs_split.add(id(sentence))
+
+    def _resegment(self):
+        import nltk
+        result = []
+        for sent in self._sentences:
+            if id(sent) in self._needs_split and sent.text:
+                pos = 0
+                for part in nltk.sent_tokenize(sent.text):
+                    start = sent.text.find(part, pos)
+                    if start == -1:
+                        result.append(Sentence(part, log=self.edits))
+                        continue
+                    result.append(sent.slice(start, start + len(part)))
+                    pos = start + len(part)
+            else:
+                result.append(sent)
+        self._sentences = result
+        self._needs_split = set()
+
+    def __iter__(self):
+        return iter(self.sentences)
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def render(self):
+        return " ".join(s.text for s in self._sentences if s.text)
+
+    def changes(self):
+        """(start, end) spans of render() written by the pipeline rather than taken from the input."""
+        spans = []
+        pos = 0
+        for sent in self._sentences:
+            if not sent.text:
+                continue
+            spans.extend((pos + start, pos + end) for start, end in sent.changes())
+            pos += len(sent.text) + 1
+        return spans
+
+
+def tag_documents(docs):
+    """POS-tag every not-yet-tagged sentence of `docs` in a single batched tagger call."""
+    tag_sentences(sent for doc in docs for sent in doc.sentences)
+
+
+def tag_sentences(sentences):
+    """POS-tag the not-yet-tagged ones among `sentences` in a single batched tagger call."""
+    pending = [sent for sent in sentences if not sent._tagged]
+    if not pending:
+        return
+    tagged = get_tagger().tag_sents([[token.text for token in sent.tokens()] for sent in pending])
+    for sent, pairs in zip(pending, tagged):
+        sent.set_tags(tag for _, tag in pairs)
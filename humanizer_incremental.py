@@ -0,0 +1,104 @@
+import difflib
+
+
+class IncrementalHumanizer:
+    """
+    Re-humanizes an edited document by redoing only the lines that changed.
+
+    `humanize` maps every input line to exactly one output line, so the previous
+    input, output and highlighted HTML are kept per line. On `update` the new
+    input is diffed against the previous one at line level; unchanged lines are
+    reused as-is and only inserted/replaced lines go through the pipeline.
+    """
+
+    def __init__(self, humanizer, inline_style=True):
+        self.humanizer = humanizer
+        # False drops the fallback inline style from highlight spans (the page's CSS styles them)
+        self.inline_style = inline_style
+        self._options = None
+        self._input_lines = []
+        self._output_lines = []
+        self._html_lines = []
+
+    def update(self, text, messiness=0.3, synonym_freq=0.3, clean_mode=True, seed=None):
+        """Humanize `text`, reusing previous results for unchanged lines. Returns (output, highlighted_html)."""
+        messiness = min(messiness, 0.3)
+        synonym_freq = min(synonym_freq, 0.3)
+        options = (messiness, synonym_freq, clean_mode, seed)
+        new_lines = text.splitlines(keepends=True)
+
+        if options != self._options:
+            # Different settings change every line, so nothing can be reused
+            self._options = options
+            self._input_lines, self._output_lines, self._html_lines = [], [], []
+
+        output_lines, html_lines = [], []
+        matcher = difflib.SequenceMatcher(None, self._input_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                output_lines.extend(self._output_lines[i1:i2])
+                html_lines.extend(self._html_lines[i1:i2])
+            elif tag in ('insert', 'replace'):
+                humanized, html = self._humanize_lines(new_lines[j1:j2], messiness, synonym_freq, clean_mode, seed)
+                output_lines.extend(humanized)
+                html_lines.extend(html)
+
+        self._input_lines, self._output_lines, self._html_lines = new_lines, output_lines, html_lines
+        return self.output, self.highlighted
+
+    def _humanize_lines(self, lines, messiness, synonym_freq, clean_mode, seed):
+        """Humanized text and highlighted HTML of each line, highlighted from the pipeline's own edits."""
+        humanizer = self.humanizer
+        split_lines = [humanizer._split_line(line) for line in lines]
+        contents = [content for _, content, _ in split_lines if content is not None]
+        results = iter(humanizer._humanize_paragraphs(contents, messiness, synonym_freq, clean_mode, seed,
+                                                      with_changes=True))
+        output_lines, html_lines = [], []
+        for line, (leading, content, trailing) in zip(lines, split_lines):
+            if content is None:
+                output_lines.append(line)
+                html_lines.append(line.replace('\n', '<br>'))
+                continue
+            humanized, changes = next(results)
+            fragment = humanizer._paragraph_fragment(content, humanized, changes, self.inline_style)
+            output_lines.append(f"{leading}{humanized}{trailing}")
+            html_lines.append(leading + fragment + trailing.replace('\n', '<br>'))
+        return output_lines, html_lines
+
+    @property
+    def output(self):
+        return "".join(self._output_lines)
+
+    @property
+    def highlighted(self):
+        return f'<div style="font-family: inherit;">{"".join(self._html_lines)}</div>'
+
+    def pages(self, page_chars=20000):
+        """
+        Split the output into (start, end) line ranges of roughly `page_chars` output characters.
+
+        Pages only break between lines, i.e. between the paragraphs `humanize`
+        works on, so no paragraph (or highlight) is ever cut in two.
+        """
+        pages = []
+        start = size = 0
+        for i, line in enumerate(self._output_lines):
+            size += len(line)
+            if size >= page_chars:
+                pages.append((start, i + 1))
+                start, size = i + 1, 0
+        if start < len(self._output_lines):
+            pages.append((start, len(self._output_lines)))
+        return pages
+
+    def highlighted_page(self, index, page_chars=20000):
+        """Highlighted HTML of page `index` of pages(page_chars) only."""
+        pages = self.pages(page_chars)
+        if not pages:
+            return self.highlighted
+        start, end = pages[min(max(index, 0), len(pages) - 1)]
+        return f'<div style="font-family: inherit;">{"".join(self._html_lines[start:end])}</div>'
+
+    def reset(self):
+        self._options = None
+        self._input_lines, self._output_lines, self._html_lines = [], [], []
@@ -0,0 +1,221 @@
+import gc
+import multiprocessing
+import os
+import random
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# The humanizer owned by this worker process, built once by _init_worker
+_worker_humanizer = None
+
+# Marks an ordered_passthrough entry whose text is still being humanized
+_PENDING = object()
+
+
+def _init_worker(config):
+    global _worker_humanizer
+    # Forked workers inherit the parent's RNG state; reseed so they don't all make the same choices
+    random.seed()
+
+    from nlp_humanizer import NLPHumanizer
+    from humanizer_synonyms import SynonymCache
+
+    config = dict(config)
+    cache_path = config.pop("synonym_cache_path", None)
+    if cache_path:
+        config["synonym_cache"] = SynonymCache(path=cache_path)
+    _worker_humanizer = NLPHumanizer(**config)
+
+
+def _humanize_chunk(task):
+    texts, options = task
+    return _worker_humanizer.humanize_many(texts, **options)
+
+
+def _highlighted_diff(task):
+    original, humanized, inline_style = task
+    return _worker_humanizer.get_highlighted_diff(original, humanized, inline_style)
+
+
+def preload_models(humanizer):
+    """
+    Load the tokenizer, tagger and WordNet in this (parent) process before forking.
+
+    NLTK keeps the loaded models in module-level caches, so forked workers
+    inherit them and share the memory pages copy-on-write instead of each
+    loading their own copy.
+    """
+    humanizer.warmup()
+    # Park everything allocated so far outside the garbage collector; otherwise
+    # collections in the workers touch every object and copy the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def create_pool(humanizer, workers, preload=False):
+    """A process pool whose workers each hold one warm copy of `humanizer`."""
+    kwargs = {}
+    if preload and "fork" in multiprocessing.get_all_start_methods():
+        preload_models(humanizer)
+        kwargs["mp_context"] = multiprocessing.get_context("fork")
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(humanizer._worker_config(),),
+        **kwargs,
+    )
+
+
+def memory_usage():
+    """RSS of this process in bytes, split into shared and private pages where the OS reports it."""
+    usage = {"pid": os.getpid(), "rss": None, "shared": None, "private": None}
+    try:
+        # Linux: smaps_rollup separates pages still shared with the parent from copied ones
+        with open(f"/proc/{os.getpid()}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+        usage["rss"] = fields.get("Rss")
+        usage["shared"] = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+        usage["private"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    except OSError:
+        try:
+            import resource
+        except ImportError:
+            # Windows: neither /proc nor resource, so the sizes stay None
+            return usage
+        # ru_maxrss is peak RSS, in kB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["rss"] = maxrss if sys.platform == "darwin" else maxrss * 1024
+    return usage
+
+
+def _worker_memory(barrier):
+    # Each probe holds its worker until all `workers` probes are running, so every worker takes exactly one
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    return memory_usage()
+
+
+def worker_memory(pool, workers, timeout=10):
+    """
+    memory_usage() of every worker in `pool`, which runs `workers` processes, one entry per pid.
+
+    If not all workers reach the probe within `timeout` seconds (e.g. some are
+    busy), the ones that did still report.
+    """
+    with multiprocessing.Manager() as manager:
+        barrier = manager.Barrier(workers, timeout=timeout)
+        futures = [pool.submit(_worker_memory, barrier) for _ in range(workers)]
+        usages = [future.result() for future in futures]
+    by_pid = {usage["pid"]: usage for usage in usages}
+    return sorted(by_pid.values(), key=lambda usage: usage["pid"])
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_ordered(executor, fn, iterable, window):
+    """
+    Like `executor.map`, but with at most `window` tasks in flight.
+
+    Inputs are pulled lazily and results come back in input order, so an
+    unbounded iterable can be streamed through the pool in constant memory.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def humanize_parallel(pool, workers, texts, options, chunk_size=16, seeds=None):
+    """
+    Yield humanized `texts` in order, sharding them across `pool` (of `workers` processes) in chunks.
+
+    `seeds`, if given, holds one seed per text and is split into the chunks alongside them.
+    """
+    if seeds is None:
+        tasks = ((chunk, options) for chunk in chunked(texts, chunk_size))
+    else:
+        tasks = (([text for text, _ in chunk], dict(options, seeds=[seed for _, seed in chunk]))
+                 for chunk in chunked(zip(texts, seeds), chunk_size))
+    # Two chunks per worker keeps every worker busy while the next results are collected
+    for results in imap_ordered(pool, _humanize_chunk, tasks, workers * 2):
+        yield from results
+
+
+def ordered_passthrough(pool, workers, items, key, options, chunk_size=16, lookup=None, store=None):
+    """
+    Yield (item, humanized text) for every item, in order, humanizing key(item) on `pool`.
+
+    Items whose key is None (blank lines, records without text) are passed
+    through with None instead of a result, without going to the pool. With
+    `lookup` (e.g. a result cache), texts it already has a result for aren't
+    sent to the pool either, and store(text, result) is called for the rest.
+    """
+    window = workers * 2
+    # Items are yielded as soon as everything ahead of them is done, so at most
+    # max_waiting are held back; past that the oldest chunk is waited for
+    max_waiting = chunk_size * (window + 2)
+    waiting = deque()  # [item, text, result] in input order; result is _PENDING until humanized
+    in_flight = deque()  # (future, entries) per submitted chunk, oldest first
+    chunk = []  # pending entries not submitted yet
+
+    def submit():
+        in_flight.append((pool.submit(_humanize_chunk, ([entry[1] for entry in chunk], options)), chunk[:]))
+        chunk.clear()
+
+    def collect():
+        future, entries = in_flight.popleft()
+        for entry, result in zip(entries, future.result()):
+            entry[2] = result
+            if store is not None:
+                store(entry[1], result)
+
+    def ready():
+        while in_flight and in_flight[0][0].done():
+            collect()
+        while waiting and waiting[0][2] is not _PENDING:
+            item, _, result = waiting.popleft()
+            yield item, result
+
+    for item in items:
+        text = key(item)
+        result = lookup(text) if text is not None and lookup is not None else None
+        entry = [item, text, _PENDING if text is not None and result is None else result]
+        waiting.append(entry)
+        if entry[2] is _PENDING:
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                submit()
+                if len(in_flight) >= window:
+                    collect()
+        elif len(waiting) >= max_waiting:
+            # Pass-through items piling up behind queued text: send that text off and wait for it
+            if chunk:
+                submit()
+            collect()
+        yield from ready()
+
+    if chunk:
+        submit()
+    while in_flight:
+        collect()
+        yield from ready()
+    yield from ready()
@@ -0,0 +1,51 @@
+import random
+import re
+
+
+class PhraseEngine:
+    """
+    All phrase-replacement rules compiled into a single case-insensitive
+    alternation, applied in one left-to-right pass.
+
+    Rules are given as ordered groups of (name, {pattern: replacement}, probability).
+    Earlier rules win when several could match at the same position, which
+    mirrors applying the maps one after another.
+    """
+
+    def __init__(self, groups):
+        self.rules = []  # (replacement, probability, group name); rule i is regex group "r<i>"
+        self.rule_ids = []  # "group:pattern", as logged in edit records
+        alternatives = []
+        for name, mapping, probability in groups:
+            for pattern, replacement in mapping.items():
+                # Named groups, so capture groups inside a pattern can't shift the rule numbering
+                alternatives.append(f"(?P<r{len(self.rules)}>{pattern})")
+                self.rules.append((replacement, probability, name))
+                self.rule_ids.append(f"{name}:{pattern}")
+        self._regex = re.compile("|".join(alternatives), re.IGNORECASE)
+
+    def draw(self, rng=random, rates=None):
+        """
+        Decide which rules are active for one call.
+
+        Probabilistic rules are switched on or off once per call (not per
+        match), like the old per-pattern `random.random() < p` checks.
+        `rates` overrides the probability of whole groups, e.g. {"informal": 0}.
+        """
+        enabled = []
+        for _, probability, name in self.rules:
+            if rates and name in rates:
+                probability = rates[name]
+            enabled.append(probability >= 1 or (probability > 0 and rng.random() < probability))
+        return enabled
+
+    def edits(self, text, enabled):
+        """The replacements the enabled rules make in `text`, as (start, end, replacement, rule id) edits."""
+        rules = self.rules
+        edits = []
+        for match in self._regex.finditer(text):
+            # The rule's own group is the outermost one, so it is always the last to close
+            index = int(match.lastgroup[1:])
+            if enabled[index]:
+                edits.append((match.start(), match.end(), rules[index][0], self.rule_ids[index]))
+        return edits
@@ -0,0 +1,346 @@
+"""
+Small asyncio HTTP API around NLPHumanizer (standard library only).
+
+    python humanizer_service.py --port 8000 --workers 4
+
+    POST /humanize        {"text": "...", "messiness": 0.3, "synonym_freq": 0.3, "clean_mode": true, "seed": 1}
+    POST /humanize/batch  {"texts": ["...", "..."], ...same options}
+    POST /diff            {"original": "...", "humanized": "...", "inline_style": true}
+    GET  /health
+
+Work runs on a thread or process executor behind a bounded queue; when the
+queue is full requests are rejected with 503 instead of piling up. Concurrent
+requests with the same options are micro-batched into one humanize_many call.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from humanizer_parallel import _highlighted_diff, _humanize_chunk, create_pool
+from nlp_humanizer import NLPHumanizer
+
+# Accepted JSON types per option, and how to describe them in a 400
+OPTION_TYPES = {
+    "messiness": ((int, float), "a number"),
+    "synonym_freq": ((int, float), "a number"),
+    "clean_mode": (bool, "a boolean"),
+    "seed": ((int, str, type(None)), "an integer, string or null"),
+}
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ServiceBusy(Exception):
+    """The request queue is full."""
+
+
+def option_error(name, value):
+    """Return a 400 message if `value` is not a valid JSON value for option `name`, else None."""
+    types, description = OPTION_TYPES[name]
+    # bool is an int subclass; only clean_mode takes one
+    if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+        return f"'{name}' must be {description}"
+    return None
+
+
+def estimate_sentences(text):
+    """Cheap sentence count used for batch sizing (no tokenizer involved)."""
+    return max(1, len(re.findall(r'[.!?]+(?:\s|$)', text)))
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for up to `max_delay_ms` (or until
+    `max_sentences` are waiting) and runs them as one batch.
+
+    Requests are grouped by their options other than `seed`, since one batch
+    is a single `humanize_many` call; each request keeps its own seed, which
+    only feeds the RNGs of its own paragraphs. `run_batch(texts, options, seeds)`
+    is awaited with the concatenated texts and one seed per text, and its
+    results are split back out to each caller.
+    """
+
+    def __init__(self, run_batch, max_delay_ms=5, max_sentences=256):
+        self.run_batch = run_batch
+        self.max_delay = max_delay_ms / 1000
+        self.max_sentences = max_sentences
+        self._pending = {}  # options key -> [entries, sentence count, timer]
+        self._tasks = set()
+
+    async def submit(self, texts, options):
+        options = dict(options)
+        seed = options.pop("seed", None)
+        key = tuple(sorted(options.items()))
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush, key)
+            batch = self._pending[key] = [[], 0, timer]
+        batch[0].append((texts, seed, future))
+        batch[1] += sum(estimate_sentences(text) for text in texts)
+        if batch[1] >= self.max_sentences:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        entries, _, timer = batch
+        timer.cancel()
+        task = asyncio.ensure_future(self._run(entries, dict(key)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, entries, options):
+        texts = [text for request_texts, _, _ in entries for text in request_texts]
+        seeds = [seed for request_texts, seed, _ in entries for _ in request_texts]
+        try:
+            results = await self.run_batch(texts, options, seeds)
+        except Exception as e:
+            for _, _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        start = 0
+        for request_texts, _, future in entries:
+            end = start + len(request_texts)
+            if not future.done():
+                future.set_result(results[start:end])
+            start = end
+
+    async def close(self):
+        """Run whatever is still waiting, then wait for running batches."""
+        for key in list(self._pending):
+            self._flush(key)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class HumanizerService:
+    """
+    Request handling independent of the transport, so it can be driven by
+    the HTTP server below or directly by `LocalClient`.
+
+    With threads, every worker shares the one warm humanizer (calls don't
+    share any mutable state). With processes, each worker process builds its
+    own humanizer once, like `humanize_many(..., workers=N)`.
+    """
+
+    def __init__(self, humanizer=None, workers=4, use_processes=False, max_queue=64,
+                 batch_delay_ms=5, batch_sentences=256):
+        self.humanizer = humanizer or NLPHumanizer()
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_queue = max_queue
+        # batch_delay_ms=0 sends every request to the executor on its own
+        self._batcher = MicroBatcher(self._humanize_batch, batch_delay_ms, batch_sentences) if batch_delay_ms else None
+        self._executor = None
+        self._queue = None
+        self._consumers = []
+
+    async def start(self):
+        if self._queue is not None:
+            return
+        if self.use_processes:
+            self._executor = create_pool(self.humanizer, self.workers, preload=self.humanizer.preload)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+
+    async def stop(self):
+        if self._batcher is not None:
+            await self._batcher.close()
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            func, future = await self._queue.get()
+            try:
+                result = await loop.run_in_executor(self._executor, func)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, func):
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((func, future))
+        except asyncio.QueueFull:
+            raise ServiceBusy()
+        return await future
+
+    async def humanize_many(self, texts, **options):
+        if self._batcher is not None:
+            return await self._batcher.submit(texts, options)
+        return await self._humanize_now(texts, options)
+
+    async def _humanize_now(self, texts, options):
+        if self.use_processes:
+            return await self._run(partial(_humanize_chunk, (texts, options)))
+        return await self._run(partial(self.humanizer.humanize_many, texts, **options))
+
+    async def _humanize_batch(self, texts, options, seeds):
+        """Run one micro-batch, each text with its own request's seed."""
+        return await self._humanize_now(texts, dict(options, seeds=seeds))
+
+    async def highlighted_diff(self, original, humanized, inline_style=True):
+        if self.use_processes:
+            return await self._run(partial(_highlighted_diff, (original, humanized, inline_style)))
+        return await self._run(partial(self.humanizer.get_highlighted_diff, original, humanized, inline_style))
+
+    async def handle(self, method, path, body=b""):
+        """Answer one request; returns (status, JSON-serializable payload)."""
+        try:
+            return await self._handle(method, path, body)
+        except ServiceBusy:
+            return 503, {"error": "server busy, retry later"}
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            return 500, {"error": "internal server error"}
+
+    async def _handle(self, method, path, body):
+        path = path.split("?", 1)[0].rstrip("/") or "/"
+        routes = {"/humanize": "POST", "/humanize/batch": "POST", "/diff": "POST", "/health": "GET"}
+        if path not in routes:
+            return 404, {"error": f"unknown path {path}"}
+        if method != routes[path]:
+            return 405, {"error": f"{path} expects {routes[path]}"}
+        if path == "/health":
+            queued = self._queue.qsize() if self._queue is not None else 0
+            return 200, {"status": "ok", "queued": queued, "max_queue": self.max_queue}
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "body must be JSON"}
+        if not isinstance(payload, dict):
+            return 400, {"error": "body must be a JSON object"}
+        options = {name: payload[name] for name in OPTION_TYPES if name in payload}
+        for name, value in options.items():
+            error = option_error(name, value)
+            if error:
+                return 400, {"error": error}
+
+        if path == "/humanize":
+            if not isinstance(payload.get("text"), str):
+                return 400, {"error": "'text' must be a string"}
+            [text] = await self.humanize_many([payload["text"]], **options)
+            return 200, {"text": text}
+        if path == "/humanize/batch":
+            texts = payload.get("texts")
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                return 400, {"error": "'texts' must be a list of strings"}
+            return 200, {"texts": await self.humanize_many(texts, **options)}
+        original, humanized = payload.get("original"), payload.get("humanized")
+        if not isinstance(original, str) or not isinstance(humanized, str):
+            return 400, {"error": "'original' and 'humanized' must be strings"}
+        inline_style = payload.get("inline_style", True)
+        if not isinstance(inline_style, bool):
+            return 400, {"error": "'inline_style' must be a boolean"}
+        return 200, {"html": await self.highlighted_diff(original, humanized, inline_style)}
+
+    async def handle_connection(self, reader, writer, max_body=16 * 1024 * 1024):
+        """Minimal HTTP/1.1: one request per connection, JSON in and out."""
+        try:
+            request_line = await reader.readline()
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0].upper(), parts[1]
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = value.strip() or "0"
+                    length = int(length) if length.isdigit() else -1
+            if length < 0:
+                status, payload = 400, {"error": "invalid Content-Length"}
+            elif length > max_body:
+                status, payload = 413, {"error": "request body too large"}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self.handle(method, path, body)
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Dropped connection or an over-long request/header line
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        await self.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class LocalClient:
+    """Stand-in client that calls the service in-process, with no sockets involved."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def post(self, path, payload):
+        return await self.service.handle("POST", path, json.dumps(payload).encode("utf-8"))
+
+    async def get(self, path):
+        return await self.service.handle("GET", path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve NLPHumanizer over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--processes", action="store_true", help="Use worker processes instead of threads")
+    parser.add_argument("--preload", action="store_true",
+                        help="With --processes, load NLTK models once before forking so workers share the memory")
+    parser.add_argument("--max-queue", type=int, default=64, help="Queued requests before answering 503")
+    parser.add_argument("--batch-delay-ms", type=float, default=5,
+                        help="How long to collect concurrent requests into one batch (0 disables batching)")
+    parser.add_argument("--batch-sentences", type=int, default=256, help="Flush a batch early at this many sentences")
+    args = parser.parse_args(argv)
+
+    service = HumanizerService(humanizer=NLPHumanizer(preload=args.preload), workers=args.workers,
+                               use_processes=args.processes, max_queue=args.max_queue,
+                               batch_delay_ms=args.batch_delay_ms, batch_sentences=args.batch_sentences)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,203 @@
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+# WordNet POS codes that simplify_vocabulary looks up (adjective, verb, adverb)
+WORDNET_TABLE_POS = ("a", "v", "r")
+
+# WordNet's irregular-form lists ("went go"), one per POS
+_EXCEPTION_FILES = {"a": "adj.exc", "v": "verb.exc", "r": "adv.exc"}
+
+# Regular inflection suffixes tried per POS: (letters to drop, suffix to add)
+_SUFFIXES = {
+    "v": [("", "s"), ("", "es"), ("y", "ies"), ("", "ed"), ("", "d"), ("y", "ied"), ("", "ing"), ("e", "ing")],
+    "a": [("", "er"), ("", "est"), ("", "r"), ("", "st"), ("y", "ier"), ("y", "iest")],
+    "r": [("", "er"), ("", "est")],
+}
+
+
+class SynonymCache:
+    """
+    Bounded LRU cache of filtered, sorted synonym candidates.
+
+    Keys are (lowercased word, WordNet POS or None). Values are the candidate
+    lists exactly as `NLPHumanizer` would build them from WordNet, so a hit
+    skips the synset walk, the filters and the sort entirely.
+    """
+
+    def __init__(self, maxsize=50000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._data)
+
+    def save(self, path=None):
+        """Write the cache to disk (least recently used first) so other workers can start warm."""
+        path = path or self.path
+        if not path:
+            raise ValueError("SynonymCache.save() needs a path (none given and the cache has no path)")
+        with self._lock:
+            rows = [[word, pos, candidates] for (word, pos), candidates in self._data.items()]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+        for word, pos, candidates in rows:
+            self.put((word, pos), candidates)
+
+
+class SynonymTable:
+    """
+    Read-only synonym table produced by `build_synonym_table`, memory-mapped from disk.
+
+    The file is UTF-8 text, one entry per line: ``word<TAB>pos<TAB>cand1<TAB>cand2``,
+    sorted bytewise so lookups are a binary search over the mapped pages.
+    Nothing is parsed up front and workers share the pages through the OS cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def get(self, word, pos=None):
+        """Candidates for (lowercased word, WordNet POS), or [] when the table has none."""
+        key = f"{word}\t{pos or '-'}\t".encode("utf-8")
+        mm = self._mm
+        lo, hi = 0, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mm.rfind(b"\n", 0, mid) + 1
+            end = mm.find(b"\n", start)
+            if end == -1:
+                end = len(mm)
+            line = mm[start:end]
+            if line.startswith(key):
+                return line[len(key):].decode("utf-8").split("\t")
+            if line < key:
+                lo = end + 1
+            else:
+                hi = start
+        return []
+
+    def close(self):
+        if self._mm:
+            self._mm.close()
+        self._file.close()
+
+
+def inflected_forms(wordnet, pos):
+    """
+    Inflected forms ("utilizes", "helped", "creating") of the WordNet lemmas of `pos`.
+
+    Regular suffixes (with a doubled final consonant for "-ed"/"-ing"/"-er")
+    are kept only when WordNet's morphy maps them back to the lemma, plus
+    every irregular form from WordNet's exception list.
+    """
+    forms = set()
+    for lemma in wordnet.all_lemma_names(pos):
+        if "_" in lemma or not lemma.isalpha():
+            continue
+        for drop, suffix in _SUFFIXES[pos] + [("", lemma[-1] + "ed"), ("", lemma[-1] + "ing"), ("", lemma[-1] + "er")]:
+            if drop and not lemma.endswith(drop):
+                continue
+            form = (lemma[:-len(drop)] if drop else lemma) + suffix
+            if form not in forms and wordnet.morphy(form, pos) == lemma:
+                forms.add(form)
+    with wordnet.open(_EXCEPTION_FILES[pos]) as f:
+        for line in f:
+            form = line.split(" ", 1)[0]
+            if form.isalpha():
+                forms.add(form.lower())
+    return forms
+
+
+def build_synonym_table(humanizer, path, words=None, top_n=2):
+    """
+    Walk WordNet once and write a `SynonymTable` file for `humanizer`'s filters.
+
+    Every WordNet lemma and its inflected forms (see `inflected_forms`) are
+    included for the adjective, verb and adverb POS that `simplify_vocabulary`
+    looks up. Each form gets its own entry, because the replacement filters
+    depend on the surface word (e.g. "helped" only takes "-ed" candidates).
+    Pass `words` (e.g. the vocabulary of a sample corpus) to cover more forms.
+    Returns the number of entries written.
+    """
+    from nltk.corpus import wordnet
+
+    lemmas = {name.lower() for name in wordnet.all_lemma_names() if "_" not in name}
+    extra = {w.lower() for w in words if w.isalpha()} if words else set()
+
+    lines = []
+    for pos in WORDNET_TABLE_POS:
+        for word in lemmas | extra | inflected_forms(wordnet, pos):
+            candidates = humanizer._wordnet_candidates(word, pos)[:top_n]
+            if candidates:
+                lines.append("\t".join([word, pos] + candidates).encode("utf-8"))
+    lines.sort()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\n".join(lines))
+    os.replace(tmp_path, path)
+    return len(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import re
+    from nlp_humanizer import NLPHumanizer
+
+    parser = argparse.ArgumentParser(description="Build a precomputed synonym table from WordNet.")
+    parser.add_argument("output", help="Table file to write")
+    parser.add_argument("--words", action="append", default=[],
+                        help="Text file whose words are added to the table (e.g. a sample corpus); repeatable")
+    args = parser.parse_args()
+
+    words = set()
+    for words_path in args.words:
+        with open(words_path, encoding="utf-8") as f:
+            words.update(re.findall(r"[A-Za-z]+", f.read()))
+    count = build_synonym_table(NLPHumanizer(), args.output, words)
+    print(f"Wrote {count} entries to {args.output}")
@@ -1,33 +1,126 @@
-import nltk
+import hashlib
+import html
+import json
+import os
 import random
 import re
-from nltk.corpus import wordnet
-from textblob import TextBlob
+import threading
+from humanizer_cache import cache_key
+from humanizer_document import DIFF_TOKEN, Document, EditLog, tag_documents, tag_sentences
+from humanizer_phrases import PhraseEngine
+from humanizer_synonyms import SynonymCache, SynonymTable
 
-# Download necessary NLTK data (required for first-run on server)
-def download_nltk_resources():
-    resources = [
-        'tokenizers/punkt',
-        'corpora/wordnet',
-        'taggers/averaged_perceptron_tagger',
-        'taggers/averaged_perceptron_tagger_eng', # New REQUIRED name for 3.9+
-        'tokenizers/punkt_tab'
-    ]
-    
-    for res in resources:
+NLTK_RESOURCES = [
+    'tokenizers/punkt',
+    'corpora/wordnet',
+    'taggers/averaged_perceptron_tagger',
+    'taggers/averaged_perceptron_tagger_eng', # New REQUIRED name for 3.9+
+    'tokenizers/punkt_tab'
+]
+
+# Remembers that this machine's NLTK data was already verified, so new processes skip the probe
+RESOURCE_MARKER = os.environ.get(
+    "NLP_HUMANIZER_MARKER", os.path.join(os.path.expanduser("~"), ".cache", "nlp_humanizer", "nltk_resources.json"))
+
+# Bump when a pipeline change alters the output for a given seed (invalidates cached results)
+PIPELINE_VERSION = 2
+
+_resources_verified = False
+_resources_lock = threading.Lock()
+
+
+def _missing_resources(nltk):
+    """NLTK_RESOURCES entries that nltk.data.find can't locate."""
+    missing = []
+    for res in NLTK_RESOURCES:
         try:
             nltk.data.find(res)
         except LookupError:
+            missing.append(res)
+    return missing
+
+
+# Download necessary NLTK data (required for first-run on server)
+def download_nltk_resources(offline=None):
+    """
+    Make sure the NLTK data we need is installed. Runs once per process, on first use.
+
+    With offline=True (or NLP_HUMANIZER_OFFLINE=1 in the environment) missing
+    data raises LookupError straight away instead of trying to download it.
+    """
+    global _resources_verified
+    if _resources_verified:
+        return
+    import nltk
+    if offline is None:
+        offline = os.environ.get("NLP_HUMANIZER_OFFLINE", "") not in ("", "0")
+
+    with _resources_lock:
+        if _resources_verified:
+            return
+        # The marker records which data paths were verified; if they haven't changed, trust it
+        marker = json.dumps({"paths": nltk.data.path, "resources": NLTK_RESOURCES})
+        try:
+            with open(RESOURCE_MARKER, encoding="utf-8") as f:
+                if f.read() == marker:
+                    _resources_verified = True
+                    return
+        except OSError:
+            pass
+
+        missing = _missing_resources(nltk)
+        if missing and offline:
+            raise LookupError(f"Missing NLTK data {missing} and offline mode is on; install it with nltk.download()")
+
+        if missing:
             # Extract just the package name from the path (e.g., 'tokenizers/punkt' -> 'punkt')
-            pkg = res.split('/')[-1]
-            nltk.download(pkg)
+            failed = [res for res in missing if not nltk.download(res.split('/')[-1])]
+            if failed:
+                raise LookupError(f"Could not download NLTK data {failed}; install it with nltk.download()")
+            # A successful download doesn't guarantee find() sees it (e.g. a different data path)
+            missing = _missing_resources(nltk)
+            if missing:
+                raise LookupError(f"NLTK data {missing} is still missing after downloading; check nltk.data.path")
 
-download_nltk_resources()
+        # Only reached with every resource present, so the marker never records a broken install
+        try:
+            os.makedirs(os.path.dirname(RESOURCE_MARKER), exist_ok=True)
+            with open(RESOURCE_MARKER, "w", encoding="utf-8") as f:
+                f.write(marker)
+        except OSError:
+            pass
+        _resources_verified = True
+
+# Shared by every NLPHumanizer in the process unless one is given its own cache
+default_synonym_cache = SynonymCache()
 
-download_nltk_resources()
+
+def _literal_edits(text, patterns):
+    """Edits replacing every occurrence of each (pattern, replacement), like chained str.replace calls."""
+    edits = []
+    for pattern, replacement in patterns:
+        start = text.find(pattern)
+        while start != -1:
+            edits.append((start, start + len(pattern), replacement, pattern))
+            start = text.find(pattern, start + len(pattern))
+    return edits
 
 class NLPHumanizer:
-    def __init__(self):
+    def __init__(self, synonym_cache=None, synonym_table=None, result_cache=None, preload=False):
+        # WordNet lookups memoized per (word, POS); pass SynonymCache(path=...) to start warm
+        self.synonym_cache = synonym_cache if synonym_cache is not None else default_synonym_cache
+        # Optional precomputed table (see build_synonym_table) used instead of WordNet
+        if isinstance(synonym_table, str):
+            synonym_table = SynonymTable(synonym_table)
+        self.synonym_table = synonym_table
+        # Optional paragraph-level cache of seeded results (MemoryResultCache / SQLiteResultCache)
+        self.result_cache = result_cache
+        # Process pool for workers > 1, created on first use; with preload the models are
+        # loaded here first and shared with the forked workers (see humanizer_parallel.preload_models)
+        self.preload = preload
+        self._pool = None
+        self._pool_workers = None
+
         self.common_synonyms = {
             "utilize": ["use", "employ", "work with"],
             "leverage": ["use", "apply", "make use of"],
@@ -113,57 +206,8 @@ class NLPHumanizer:
             r"\bhowever\b": "but",
         }
 
-    # In nlp_humanizer.py, replace the _get_synonym method:
-
-    def _get_synonym(self, word, pos=None):
-        """Get a contextually appropriate synonym."""
-        word_lower = word.lower()
-        
-        # First check if word is in banned list
-        if word_lower in self.banned_words:
-            return "[FILTERED]"
-        
-        # Get WordNet synsets
-        synsets = wordnet.synsets(word)
-        if not synsets:
-            return word
-            
-        synonyms = []
-        for syn in synsets:
-            # Filter by part of speech if provided
-            if pos:
-                wn_pos = None
-                if pos.startswith('J'): wn_pos = wordnet.ADJ
-                elif pos.startswith('V'): wn_pos = wordnet.VERB
-                elif pos.startswith('N'): wn_pos = wordnet.NOUN
-                elif pos.startswith('R'): wn_pos = wordnet.ADV
-                if wn_pos and syn.pos() != wn_pos:
-                    continue
-            
-            # Get lemmas
-            for lemma in syn.lemmas():
-                name = lemma.name().replace('_', ' ')
-                
-                # Quality filters
-                if self._is_valid_replacement(word, name):
-                    synonyms.append(name)
-        
-        if not synonyms:
-            return word
-        
-        # Score synonyms by commonness (rough heuristic - shorter = more common)
-        # We prefer words that are shorter than the original
-        synonyms.sort(key=lambda x: (len(x), x))
-        
-        # Pick from top 2 most common synonyms for better stability
-        top_synonyms = synonyms[:2]
-        if top_synonyms:
-            return random.choice(top_synonyms)
-        return word
-
-    def _replace_phrases(self, text):
-        """Replace common AI multi-word phrases."""
-        phrases = {
+        # Common AI multi-word phrases
+        self.phrases = {
             r"\bin conclusion\b": "so basically",
             r"\bplay a crucial role\b": "are super important",
             r"\bplays a crucial role\b": "is super important",
@@ -215,77 +259,9 @@ class NLPHumanizer:
             r"\bprovide guidance on\b": "help with",
             r"\bincrease the efficiency of\b": "speed up",
         }
-        for pattern, repl in phrases.items():
-            text = re.sub(pattern, repl, text, flags=re.IGNORECASE)
-        
-        # Also replace stuffy transitions
-        for pattern, repl in self.transitions.items():
-            if random.random() < 0.8:
-                text = re.sub(pattern, repl, text, flags=re.IGNORECASE)
-                
-        return text
-
-    def simplify_vocabulary(self, text, frequency=0.5):
-        """Aggressive vocabulary replacement."""
-        # Use sentence tokenization first to avoid breaking punctuation
-        sentences = nltk.sent_tokenize(text)
-        final_sentences = []
-        
-        for sentence in sentences:
-            words = nltk.word_tokenize(sentence)
-            tagged = nltk.pos_tag(words)
-            new_sentence_words = []
-            
-            for word, tag in tagged:
-                lower_word = word.lower()
-                
-                # Skip punctuation
-                if not re.match(r'\w+', word):
-                    new_sentence_words.append(word)
-                    continue
-
-                # 1. Skip Proper Nouns (Preserve Company Names/Names)
-                # NNP: Proper noun, singular; NNPS: Proper noun, plural
-                if tag in ['NNP', 'NNPS']:
-                    new_sentence_words.append(word)
-                    continue
 
-                # 2. Check strict list first
-                if lower_word in self.common_synonyms:
-                    replacement = random.choice(self.common_synonyms[lower_word])
-                    if word[0].isupper(): replacement = replacement.capitalize()
-                    new_sentence_words.append(replacement)
-                    continue
-                
-                # 3. Target POS: Adjectives, Adverbs, Verbs
-                # We EXCLUDE Nouns (NN, NNS) from general WordNet replacement to preserve meaning
-                is_target_pos = (tag.startswith('JJ') or tag.startswith('RB') or 
-                               tag.startswith('VB'))
-                
-                if is_target_pos and len(word) > 3 and random.random() < frequency: 
-                    synonym = self._get_synonym(word, pos=tag)
-                    if synonym and synonym != word:
-                        if word[0].isupper(): synonym = synonym.capitalize()
-                        new_sentence_words.append(synonym)
-                    else:
-                        new_sentence_words.append(word)
-                else:
-                    new_sentence_words.append(word)
-            
-            # Reconstruct sentence with proper spacing
-            reconstructed = ""
-            for i, w in enumerate(new_sentence_words):
-                if i > 0 and not re.match(r'[^\w\s]', w):
-                    reconstructed += " " + w
-                else:
-                    reconstructed += w
-            final_sentences.append(reconstructed)
-                
-        return " ".join(final_sentences)
-
-    def _remove_flowery_language(self, text):
-        """Remove poetic/AI-typical words."""
-        flowery_map = {
+        # Poetic/AI-typical words
+        self.flowery_map = {
             r"\btapestry\b": "mix",
             r"\bsymphony\b": "sound",
             r"\bwhisper\b": "say",
@@ -307,31 +283,9 @@ class NLPHumanizer:
             r"\bnavigation\b": "moving",
             r"\baligns\b": "fits",
         }
-        for pattern, repl in flowery_map.items():
-            text = re.sub(pattern, repl, text, flags=re.IGNORECASE)
-        return text
-
-    def _break_participles(self, text):
-        """Break '..., doing X' patterns which AI loves."""
-        # ", creating" -> ". This creates" (Approximate)
-        patterns = [
-            (r", creating", ". This makes"),
-            (r", causing", ". This causes"),
-            (r", allowing", ". This lets"),
-            (r", leading to", ". This leads to"),
-            (r", providing", ". This gives"),
-            (r", ensuring", ". This makes sure"),
-            (r", highlighting", ". This shows"),
-            (r", resulting in", ". This ends up in"),
-        ]
-        for pattern, repl in patterns:
-            if random.random() < 0.7:
-                text = text.replace(pattern, repl)
-        return text
 
-    def enforce_contractions(self, text):
-        """Force 'do not' -> 'don't', etc."""
-        replacements = {
+        # Force 'do not' -> 'don't', etc.
+        self.contractions = {
             r"\bdo not\b": "don't",
             r"\bcannot\b": "can't",
             r"\bis not\b": "isn't",
@@ -348,28 +302,9 @@ class NLPHumanizer:
             r"\bI am\b": "I'm",
             r"\bit is\b": "it's"
         }
-        
-        for pattern, replacement in replacements.items():
-            text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-        return text
-
-    def inject_noise(self, text, frequency=0.1):
-        """Inject conversational filler words."""
-        sentences = nltk.sent_tokenize(text)
-        new_sentences = []
-        
-        for sent in sentences:
-            if random.random() < frequency:
-                filler = random.choice(self.filler_words)
-                # Ensure spacing is correct
-                sent = f"{filler} {sent[0].lower() + sent[1:]}"
-            new_sentences.append(sent)
-            
-        return " ".join(new_sentences)
 
-    def _informal_contractions(self, text):
-        """Advanced informal contractions."""
-        replacements = {
+        # Advanced informal contractions
+        self.informal_contractions = {
             r"\bgoing to\b": "gonna",
             r"\bwant to\b": "wanna",
             r"\bhave to\b": "got a",
@@ -378,12 +313,245 @@ class NLPHumanizer:
             r"\bsort of\b": "sort a",
             r"\byou know\b": "y'know",
         }
-        for pattern, replacement in replacements.items():
-            if random.random() < 0.5: # 50% chance
-                text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-        return text
 
-    def _fragment_sentences(self, text):
+        # Every rule is compiled once here and applied in a single pass per sentence
+        self._phrase_engine = PhraseEngine([
+            ("phrases", self.phrases, 1.0),
+            ("transitions", self.transitions, 0.8),
+            ("flowery", self.flowery_map, 1.0),
+        ])
+        self._contraction_engine = PhraseEngine([
+            ("contractions", self.contractions, 1.0),
+            ("informal", self.informal_contractions, 0.5),
+        ])
+        # Cheap pre-scan for sentences that contain a common_synonyms word (whole words only)
+        self._trigger_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(word) for word in sorted(self.common_synonyms, key=len, reverse=True)) + r")\b",
+            re.IGNORECASE)
+
+        # Fingerprint of the rule tables, part of every result-cache key so rule edits invalidate old results
+        rules = [self.common_synonyms, sorted(self.stuffy_words), sorted(self.banned_words), self.filler_words,
+                 self.transitions, self.phrases, self.flowery_map, self.contractions, self.informal_contractions,
+                 self.synonym_table.path if self.synonym_table is not None else "wordnet", PIPELINE_VERSION]
+        self.rules_version = hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()[:16]
+
+    # In nlp_humanizer.py, replace the _get_synonym method:
+
+    def _get_synonym(self, word, pos=None, rng=random):
+        """Get a contextually appropriate synonym."""
+        word_lower = word.lower()
+        
+        # First check if word is in banned list
+        if word_lower in self.banned_words:
+            return "[FILTERED]"
+        
+        # Pick from top 2 most common synonyms for better stability
+        top_synonyms = self._synonym_candidates(word, pos)[:2]
+        if top_synonyms:
+            return rng.choice(top_synonyms)
+        return word
+
+    def _synonym_candidates(self, word, pos=None):
+        """Filtered synonyms for `word`, most common first (memoized per word and POS)."""
+        # WordNet POS codes; using the literals keeps the table path from loading WordNet
+        wn_pos = None
+        if pos:
+            if pos.startswith('J'): wn_pos = 'a'
+            elif pos.startswith('V'): wn_pos = 'v'
+            elif pos.startswith('N'): wn_pos = 'n'
+            elif pos.startswith('R'): wn_pos = 'r'
+
+        # Precomputed table: no WordNet at all, misses simply mean "no synonym"
+        if self.synonym_table is not None:
+            return self.synonym_table.get(word.lower(), wn_pos)
+
+        key = (word.lower(), wn_pos)
+        synonyms = self.synonym_cache.get(key)
+        if synonyms is None:
+            synonyms = self._wordnet_candidates(word, wn_pos)
+            self.synonym_cache.put(key, synonyms)
+        return synonyms
+
+    def _may_have_synonym(self, word):
+        """
+        False only if `word` is known to have no synonym as an adjective, verb or adverb.
+
+        Never touches WordNet: with no table, a POS the synonym cache hasn't
+        seen yet counts as a possible hit.
+        """
+        word_lower = word.lower()
+        # Banned words are replaced with a marker whatever their synonyms
+        if word_lower in self.banned_words:
+            return True
+        for wn_pos in ('a', 'v', 'r'):
+            if self.synonym_table is not None:
+                if self.synonym_table.get(word_lower, wn_pos):
+                    return True
+            elif self.synonym_cache.get((word_lower, wn_pos)) != []:
+                return True
+        return False
+
+    def _wordnet_candidates(self, word, wn_pos=None):
+        """Walk WordNet for `word` and apply the replacement filters."""
+        download_nltk_resources()
+        # WordNet is only imported (and loaded) the first time a synonym lookup misses
+        from nltk.corpus import wordnet
+        synonyms = []
+        for syn in wordnet.synsets(word):
+            # Filter by part of speech if provided
+            if wn_pos and syn.pos() != wn_pos:
+                continue
+            
+            # Get lemmas
+            for lemma in syn.lemmas():
+                name = lemma.name().replace('_', ' ')
+                
+                # Quality filters
+                if self._is_valid_replacement(word, name):
+                    synonyms.append(name)
+        
+        # Score synonyms by commonness (rough heuristic - shorter = more common)
+        # We prefer words that are shorter than the original
+        synonyms.sort(key=lambda x: (len(x), x))
+        return synonyms
+
+    def _replace_phrases(self, doc, rng=random):
+        """Replace common AI multi-word phrases, stuffy transitions and poetic words in one pass."""
+        doc.edits.stage = "phrases"
+        enabled = self._phrase_engine.draw(rng)
+        for sent in doc:
+            sent.apply_edits(self._phrase_engine.edits(sent.text, enabled))
+
+    def simplify_vocabulary(self, text, frequency=0.5, rng=random):
+        """Aggressive vocabulary replacement."""
+        download_nltk_resources()
+        doc = Document(text)
+        self._simplify_vocabulary(doc, frequency, rng)
+        return doc.render()
+
+    def _simplify_vocabulary(self, doc, frequency=0.5, rng=random):
+        candidates = self._vocabulary_candidates(doc, frequency, rng)
+        tag_sentences(sentence for sentence, _ in candidates)
+        self._apply_vocabulary(doc, candidates, rng)
+
+    def _vocabulary_candidates(self, doc, frequency=0.5, rng=random):
+        """
+        Tokens the vocabulary stage may replace, as (sentence, [(token, is_common)]).
+
+        Runs before POS tagging: words from `common_synonyms` are always kept
+        and every other word gets its `frequency` draw up front, then is kept
+        only if it may have a synonym, so sentences with no candidate left are
+        never tagged at all. Dropped words would make no RNG draws later, so
+        the output is the same as tagging everything.
+        """
+        candidates = []
+        for sentence in doc:
+            # No draws to make and no trigger word anywhere: skip the tokenizer too
+            if not frequency and not self._trigger_pattern.search(sentence.text):
+                continue
+            picked = []
+            for token in sentence.tokens():
+                word = token.text
+                # Skip punctuation (and tokens we could not place in the sentence)
+                if token.start < 0 or not re.match(r'\w+', word):
+                    continue
+                if word.lower() in self.common_synonyms:
+                    picked.append((token, True))
+                elif len(word) > 3 and rng.random() < frequency and self._may_have_synonym(word):
+                    picked.append((token, False))
+            if picked:
+                candidates.append((sentence, picked))
+        return candidates
+
+    def _apply_vocabulary(self, doc, candidates, rng=random):
+        # Words are replaced in place at their token offsets so the original
+        # spacing and punctuation of each sentence is kept as-is
+        doc.edits.stage = "vocabulary"
+        for sentence, picked in candidates:
+            sentence.tagged()
+            edits = []
+            
+            for token, is_common in picked:
+                word, tag = token.text, token.tag
+
+                # 1. Skip Proper Nouns (Preserve Company Names/Names)
+                # NNP: Proper noun, singular; NNPS: Proper noun, plural
+                if tag in ['NNP', 'NNPS']:
+                    continue
+
+                # 2. Check strict list first
+                if is_common:
+                    replacement = rng.choice(self.common_synonyms[word.lower()])
+                    if word[0].isupper(): replacement = replacement.capitalize()
+                    edits.append((token.start, token.end, replacement, f"common_synonyms:{word.lower()}"))
+                    continue
+                
+                # 3. Target POS: Adjectives, Adverbs, Verbs
+                # We EXCLUDE Nouns (NN, NNS) from general WordNet replacement to preserve meaning
+                # (the frequency draw was already made when the token was picked)
+                is_target_pos = (tag.startswith('JJ') or tag.startswith('RB') or 
+                               tag.startswith('VB'))
+                
+                if is_target_pos:
+                    synonym = self._get_synonym(word, pos=tag, rng=rng)
+                    if synonym and synonym != word:
+                        if word[0].isupper(): synonym = synonym.capitalize()
+                        edits.append((token.start, token.end, synonym, f"synonym:{word.lower()}"))
+            
+            sentence.apply_edits(edits)
+
+    def _break_participles(self, doc, rng=random):
+        """Break '..., doing X' patterns which AI loves."""
+        # ", creating" -> ". This creates" (Approximate)
+        patterns = [
+            (r", creating", ". This makes"),
+            (r", causing", ". This causes"),
+            (r", allowing", ". This lets"),
+            (r", leading to", ". This leads to"),
+            (r", providing", ". This gives"),
+            (r", ensuring", ". This makes sure"),
+            (r", highlighting", ". This shows"),
+            (r", resulting in", ". This ends up in"),
+        ]
+        patterns = [(p, r) for p, r in patterns if rng.random() < 0.7]
+        doc.edits.stage = "participles"
+        for sent in doc:
+            edits = _literal_edits(sent.text, patterns)
+            if edits:
+                sent.apply_edits(edits)
+                doc.mark_split(sent)
+
+    def enforce_contractions(self, text, rng=random):
+        """Force 'do not' -> 'don't', etc."""
+        download_nltk_resources()
+        doc = Document(text)
+        self._enforce_contractions(doc, rng=rng)
+        return doc.render()
+
+    def _enforce_contractions(self, doc, informal=False, rng=random):
+        # Informal contractions ride along in the same pass, each at its own 50% chance
+        rates = None if informal else {"informal": 0}
+        enabled = self._contraction_engine.draw(rng, rates)
+        doc.edits.stage = "contractions"
+        for sent in doc:
+            sent.apply_edits(self._contraction_engine.edits(sent.text, enabled))
+
+    def inject_noise(self, text, frequency=0.1, rng=random):
+        """Inject conversational filler words."""
+        download_nltk_resources()
+        doc = Document(text)
+        self._inject_noise(doc, frequency, rng)
+        return doc.render()
+
+    def _inject_noise(self, doc, frequency=0.1, rng=random):
+        doc.edits.stage = "noise"
+        for sent in doc:
+            if rng.random() < frequency and sent.text:
+                filler = rng.choice(self.filler_words)
+                # Ensure spacing is correct
+                sent.apply_edits([(0, 0, f"{filler} "), (0, 1, sent.text[0].lower())], rule=filler)
+
+    def _fragment_sentences(self, doc, rng=random):
         """Break perfect grammar by splitting sentences at conjunctions."""
         # Split 'which', 'but', 'because' into new sentences starting with lowercase
         patterns = [
@@ -392,77 +560,80 @@ class NLPHumanizer:
             (r", and", " and"),
             (r" because", ". because"),
         ]
-        for pattern, repl in patterns:
-            if random.random() < 0.4:
-                text = text.replace(pattern, repl)
-        return text
+        patterns = [(p, r) for p, r in patterns if rng.random() < 0.4]
+        doc.edits.stage = "fragments"
+        for sent in doc:
+            edits = _literal_edits(sent.text, patterns)
+            if edits:
+                sent.apply_edits(edits)
+                doc.mark_split(sent)
 
-    def _apply_burstiness(self, text):
+    def _apply_burstiness(self, doc, rng=random):
         """Vary sentence length significantly (Burstiness)."""
-        sentences = nltk.sent_tokenize(text)
+        sentences = doc.sentences
         if len(sentences) < 2:
-            return text
+            return
+        doc.edits.stage = "burstiness"
             
         new_sentences = []
         i = 0
         while i < len(sentences):
             sent = sentences[i]
-            words = sent.split()
+            words = sent.text.split()
             
             # If sentence is long, see if we can split it or keep it
-            if len(words) > 15 and random.random() < 0.3:
+            if len(words) > 15 and rng.random() < 0.3:
                 # Add a very short sentence after it to create contrast
                 new_sentences.append(sent)
                 if i + 1 < len(sentences):
-                    next_words = sentences[i+1].split()
+                    next_words = sentences[i+1].text.split()
                     if len(next_words) > 5:
-                        new_sentences.append(random.choice(["Right", "Exactly", "Think about it", "It's true"]))
+                        new_sentences.append(doc.new_sentence(
+                            rng.choice(["Right", "Exactly", "Think about it", "It's true"]), sent, rule="short_sentence"))
             
             # If sentence is short, maybe merge with next one using informal bridge
-            elif len(words) < 8 and i + 1 < len(sentences) and random.random() < 0.4:
-                bridge = random.choice([" and ", " .. ", " - "])
-                combined = sent.rstrip('.') + bridge + sentences[i+1][0].lower() + sentences[i+1][1:]
-                new_sentences.append(combined)
+            elif len(words) < 8 and i + 1 < len(sentences) and sentences[i+1].text and rng.random() < 0.4:
+                bridge = rng.choice([" and ", " .. ", " - "])
+                following = sentences[i+1]
+                following.apply_edits([(0, 1, following.text[0].lower())], rule="bridge")
+                sent.apply_edits([(len(sent.text.rstrip('.')), len(sent.text), bridge)], rule="bridge")
+                # Joined piecewise so the following sentence keeps its own edit history
+                sent.extend(following)
+                new_sentences.append(sent)
                 i += 1 # skip next
             else:
                 new_sentences.append(sent)
             i += 1
             
-        return " ".join(new_sentences)
+        doc.sentences = new_sentences
 
-    def _reorder_clauses(self, text):
+    def _reorder_clauses(self, doc):
         """Reorder clauses to break standard AI patterns."""
         # Simple pattern: "Because [X], [Y]" -> "[Y], mostly because [X]"
-        sentences = nltk.sent_tokenize(text)
-        new_sentences = []
-        for sent in sentences:
-            if sent.lower().startswith("because ") and "," in sent:
-                parts = sent.split(",", 1)
-                reordered = parts[1].strip().capitalize().rstrip('.') + ", mostly " + parts[0].lower() + "."
-                new_sentences.append(reordered)
-            elif " although " in sent.lower():
-                parts = re.split(r" although ", sent, flags=re.IGNORECASE)
-                if len(parts) == 2:
-                    reordered = "Even though " + parts[1].strip() + ", " + parts[0].strip()[0].lower() + parts[0].strip()[1:]
-                    new_sentences.append(reordered)
-            else:
-                new_sentences.append(sent)
-        return " ".join(new_sentences)
+        doc.edits.stage = "clauses"
+        for sent in doc:
+            text = sent.text
+            if text.lower().startswith("because ") and "," in text:
+                parts = text.split(",", 1)
+                sent.rewrite(parts[1].strip().capitalize().rstrip('.') + ", mostly " + parts[0].lower() + ".",
+                             rule="because")
+            elif " although " in text.lower():
+                parts = re.split(r" although ", text, flags=re.IGNORECASE)
+                if len(parts) == 2 and parts[0].strip():
+                    sent.rewrite("Even though " + parts[1].strip() + ", " + parts[0].strip()[0].lower() + parts[0].strip()[1:],
+                                 rule="although")
 
 
-    def _restructure_sentences(self, text):
+    def _restructure_sentences(self, doc):
         """Advanced sentence restructuring to break standard AI syntax."""
-        sentences = nltk.sent_tokenize(text)
-        new_sentences = []
-        
-        for sent in sentences:
-            words = nltk.word_tokenize(sent)
+        doc.edits.stage = "restructure"
+        for sent in doc:
             # Example: "It is [Adj] that [Clause]" -> "[Clause] is definitely [Adj]"
-            it_is_match = re.match(r"^It is (\w+) that (.+)", sent, re.IGNORECASE)
+            it_is_match = re.match(r"^It is (\w+) that (.+)", sent.text, re.IGNORECASE)
             if it_is_match:
                 adj = it_is_match.group(1)
                 clause = it_is_match.group(2).rstrip('.!?')
-                new_sentences.append(f"{clause.capitalize()} is clearly {adj}.")
+                sent.rewrite(f"{clause.capitalize()} is clearly {adj}.", rule="it_is_that")
                 continue
             
             # Example: "[Subject] [Verb] [Object]" -> "The [Object] was [Verb-ed] by [Subject]" (Simple Passive)
@@ -470,32 +641,29 @@ class NLPHumanizer:
             # but we can do some simple structure shifts.
             
             # Simple shift: "[Adverb], [Clause]" -> "[Clause], [Adverb-ly]"
-            adverb_match = re.match(r"^(\w+ly), (.+)", sent, re.IGNORECASE)
+            adverb_match = re.match(r"^(\w+ly), (.+)", sent.text, re.IGNORECASE)
             if adverb_match:
                 adv = adverb_match.group(1)
                 clause = adverb_match.group(2).rstrip('.!?')
-                new_sentences.append(f"{clause.capitalize()} {adv.lower()}.")
-                continue
-                
-            new_sentences.append(sent)
-            
-        return " ".join(new_sentences)
+                sent.rewrite(f"{clause.capitalize()} {adv.lower()}.", rule="adverb_first")
 
-    def _add_imperfections(self, text):
+    def _add_imperfections(self, doc, rng=random):
         """Add human-like typing imperfections."""
-        sentences = nltk.sent_tokenize(text)
-        new_sentences = []
-        for sent in sentences:
+        doc.edits.stage = "imperfections"
+        for sent in doc:
+            text = sent.text
+            edits = []
+            end = len(text)
             # 1. Remove trailing periods (texting style)
-            if random.random() < 0.1 and sent.endswith('.'):
-                sent = sent[:-1]
+            if rng.random() < 0.1 and text.endswith('.'):
+                end -= 1
+                edits.append((end, len(text), "", "trailing_period"))
             
             # 2. Lowercase start of sentence (lazy typing)
-            if random.random() < 0.15 and len(sent) > 0:
-                sent = sent[0].lower() + sent[1:]
+            if rng.random() < 0.15 and end > 0:
+                edits.append((0, 1, text[0].lower(), "lowercase_start"))
                 
-            new_sentences.append(sent)
-        return " ".join(new_sentences)
+            sent.apply_edits(edits)
 
     def _is_valid_replacement(self, original, replacement):
         """Check if replacement is valid and makes sense."""
@@ -540,10 +708,11 @@ class NLPHumanizer:
         
         return True
 
-    def humanize(self, text, messiness=0.3, synonym_freq=0.3, clean_mode=True):
+    def humanize(self, text, messiness=0.3, synonym_freq=0.3, clean_mode=True, workers=None, seed=None,
+                 return_edits=False):
         """Preserve original line structure perfectly."""
         if not text:
-            return ""
+            return ("", EditLog()) if return_edits else ""
             
         """
         Transform AI text to human-like text.
@@ -553,34 +722,286 @@ class NLPHumanizer:
             messiness: 0.0-1.0 - How much to alter structure (lower = safer)
             synonym_freq: 0.0-1.0 - How often to replace words (lower = safer)
             clean_mode: If True, avoid informal contractions and slang
+            workers: If > 1, humanize the lines on a process pool (for very long documents)
+            seed: Makes the output reproducible; every paragraph gets its own RNG derived
+                from the seed and its text, so results don't depend on batching or workers
+            return_edits: If True, return (output, EditLog) recording every edit with its
+                offsets in `text`, stage and rule. Always computed in this process, since
+                cached and pooled results carry no edit log
         """
         # Cap values for safety
         messiness = min(messiness, 0.3)  # Max 40% structural changes
         synonym_freq = min(synonym_freq, 0.3)  # Max 30% word replacement
     
         # Use splitlines(True) to keep all original newline characters (\n, \r\n, etc.)
+        # Blank lines are kept as-is; every other line is (indentation, content, trailing whitespace)
         lines = text.splitlines(keepends=True)
-        humanized_lines = []
-        
-        for line in lines:
-            # Handle empty or whitespace lines
-            if not line.strip():
-                humanized_lines.append(line)
-                continue
-                
-            # Extract leading and trailing whitespace from this line
-            # This captures indentation and the newline at the end
-            match = re.match(r'^(\s*)(.*?)(\s*)$', line, re.DOTALL)
-            if match:
-                leading, content, trailing = match.groups()
-                # Process the textual content
-                humanized_content = self._humanize_internal(content, messiness, synonym_freq, clean_mode)
-                # Reconstruct the line
-                humanized_lines.append(f"{leading}{humanized_content}{trailing}")
-            else:
-                humanized_lines.append(line)
-                
-        return "".join(humanized_lines)
+        split_lines = [self._split_line(line) for line in lines]
+        contents = [content for _, content, _ in split_lines if content is not None]
+        if return_edits:
+            docs = []
+            humanized = self._humanize_batch(contents, messiness, synonym_freq, clean_mode, seed, docs)
+            return self._join_lines(split_lines, iter(humanized)), self._collect_edits(lines, split_lines, docs)
+        humanized = self._humanize_paragraphs(contents, messiness, synonym_freq, clean_mode, seed, workers)
+        return self._join_lines(split_lines, iter(humanized))
+
+    def humanize_many(self, texts, messiness=0.3, synonym_freq=0.3, clean_mode=True, workers=None, seed=None,
+                      seeds=None):
+        """
+        Humanize a list of documents, returning results in the same order.
+
+        Same options as `humanize`. Every paragraph of every document is
+        POS-tagged in one batched tagger call instead of once per sentence.
+        With `workers` > 1 the paragraphs are sharded across a process pool
+        that is kept alive for later calls (see `close`). `seeds`, if given,
+        holds one seed per text and takes the place of `seed`, so documents
+        with different seeds can still share one batch.
+        """
+        messiness = min(messiness, 0.3)
+        synonym_freq = min(synonym_freq, 0.3)
+
+        split_texts = [[self._split_line(line) for line in (text or "").splitlines(keepends=True)]
+                       for text in texts]
+        contents = [content for lines in split_texts for _, content, _ in lines if content is not None]
+        if seeds is not None:
+            # One seed per paragraph, repeating each text's seed for all of its paragraphs
+            seeds = [text_seed for lines, text_seed in zip(split_texts, seeds)
+                     for _, content, _ in lines if content is not None]
+        humanized = iter(self._humanize_paragraphs(contents, messiness, synonym_freq, clean_mode, seed, workers,
+                                                   seeds=seeds))
+        return [self._join_lines(lines, humanized) for lines in split_texts]
+
+    def humanize_highlighted(self, text, messiness=0.3, synonym_freq=0.3, clean_mode=True, workers=None, seed=None,
+                             inline_style=True):
+        """
+        Humanize `text` like `humanize` and return (output, highlighted_html).
+
+        The highlighting comes from the spans the pipeline itself rewrote, in
+        linear time; only paragraphs served from the result cache or a worker
+        pool (which carry no edit log) are diffed against their input instead.
+        Pass inline_style=False when the page styles `.humanized-highlight` itself.
+        """
+        messiness = min(messiness, 0.3)
+        synonym_freq = min(synonym_freq, 0.3)
+
+        split_lines = [self._split_line(line) for line in (text or "").splitlines(keepends=True)]
+        contents = [content for _, content, _ in split_lines if content is not None]
+        results = self._humanize_paragraphs(contents, messiness, synonym_freq, clean_mode, seed, workers,
+                                            with_changes=True)
+        output = self._join_lines(split_lines, (humanized for humanized, _ in results))
+        fragments = (self._paragraph_fragment(content, humanized, changes, inline_style)
+                     for content, (humanized, changes) in zip(contents, results))
+        html_lines = [(leading.replace('\n', '<br>'), content, trailing.replace('\n', '<br>'))
+                      for leading, content, trailing in split_lines]
+        return output, f'<div style="font-family: inherit;">{self._join_lines(html_lines, fragments)}</div>'
+
+    def humanize_stream(self, lines, messiness=0.3, synonym_freq=0.3, clean_mode=True, seed=None, workers=None):
+        """
+        Humanize an iterable of text (e.g. an open file) and yield output lines as they are ready.
+
+        Chunks don't have to be whole lines: input is re-split with
+        splitlines(keepends=True) exactly like `humanize`, holding back only
+        the current unfinished line, so memory stays constant for any input size.
+        With `workers` > 1, lines are humanized on the process pool with a
+        bounded number of chunks in flight, still in order.
+        """
+        messiness = min(messiness, 0.3)
+        synonym_freq = min(synonym_freq, 0.3)
+
+        if workers and workers > 1:
+            options = dict(messiness=messiness, synonym_freq=synonym_freq, clean_mode=clean_mode, seed=seed)
+            yield from self._stream_parallel(self._iter_lines(lines), options, workers)
+            return
+
+        for line in self._iter_lines(lines):
+            yield self._humanize_line(line, messiness, synonym_freq, clean_mode, seed)
+
+    def _iter_lines(self, chunks):
+        """Re-split arbitrary text chunks into complete lines (keepends, like str.splitlines)."""
+        pending = ""
+        for chunk in chunks:
+            pending += chunk
+            parts = pending.splitlines(keepends=True)
+            pending = ""
+            # Hold back an unterminated last line, or a '\r' whose '\n' may be in the next chunk
+            last = parts[-1] if parts else ""
+            if last and (last.splitlines()[0] == last or last.endswith("\r")):
+                pending = parts.pop()
+            yield from parts
+        if pending:
+            yield pending
+
+    def _stream_parallel(self, lines, options, workers):
+        from humanizer_parallel import ordered_passthrough
+        parts = map(self._split_line, lines)
+        lookup, store = self._cache_hooks(**options)
+        # Blank lines (content None) come back as-is, in place
+        for (leading, content, trailing), humanized in ordered_passthrough(
+                self._get_pool(workers), workers, parts, lambda line_parts: line_parts[1], options, chunk_size=32,
+                lookup=lookup, store=store):
+            yield leading if content is None else f"{leading}{humanized}{trailing}"
+
+    def _humanize_line(self, line, messiness, synonym_freq, clean_mode, seed=None):
+        leading, content, trailing = self._split_line(line)
+        if content is None:
+            return line
+        humanized = self._humanize_paragraphs([content], messiness, synonym_freq, clean_mode, seed)[0]
+        return f"{leading}{humanized}{trailing}"
+
+    def _humanize_paragraphs(self, contents, messiness, synonym_freq, clean_mode, seed=None, workers=None,
+                             with_changes=False, seeds=None):
+        """
+        Humanize paragraph texts, taking unchanged ones from the result cache when seeded.
+
+        `seeds` optionally gives each paragraph its own seed instead of `seed`.
+        With `with_changes`, returns (text, changes) pairs where changes are the
+        spans the pipeline wrote (see Document.changes), or None for paragraphs
+        that came from the cache or the worker pool.
+        """
+        if seeds is None:
+            seeds = [seed] * len(contents)
+        # Unseeded output is meant to differ on every run, so it is never cached
+        keys = [None] * len(contents)
+        if self.result_cache is not None:
+            keys = [None if paragraph_seed is None else
+                    cache_key(content, messiness, synonym_freq, clean_mode, paragraph_seed, self.rules_version)
+                    for content, paragraph_seed in zip(contents, seeds)]
+        results = [None if key is None else self.result_cache.get(key) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        pending = [contents[i] for i in missing]
+        pending_seeds = [seeds[i] for i in missing]
+        batch_docs = [] if with_changes else None
+        if workers and workers > 1 and len(pending) > 1:
+            options = dict(messiness=messiness, synonym_freq=synonym_freq, clean_mode=clean_mode)
+            chunk_size = max(1, min(64, len(pending) // (workers * 4)))
+            from humanizer_parallel import humanize_parallel
+            computed = humanize_parallel(self._get_pool(workers), workers, pending, options, chunk_size,
+                                         seeds=pending_seeds)
+        else:
+            computed = self._humanize_batch(pending, messiness, synonym_freq, clean_mode, docs_out=batch_docs,
+                                            seeds=pending_seeds)
+
+        for i, result in zip(missing, computed):
+            results[i] = result
+            if keys[i] is not None:
+                self.result_cache.put(keys[i], result)
+        if not with_changes:
+            return results
+        changes = [None] * len(contents)
+        for i, doc in zip(missing, batch_docs):
+            changes[i] = doc.changes()
+        return list(zip(results, changes))
+
+    def _cache_hooks(self, messiness=0.3, synonym_freq=0.3, clean_mode=True, seed=None):
+        """(lookup, store) for the result cache, for paragraphs sent to the pool directly; (None, None) if uncached."""
+        # Same rule as _humanize_paragraphs: unseeded output is never cached
+        if self.result_cache is None or seed is None:
+            return None, None
+        messiness = min(messiness, 0.3)
+        synonym_freq = min(synonym_freq, 0.3)
+
+        def key(content):
+            return cache_key(content, messiness, synonym_freq, clean_mode, seed, self.rules_version)
+
+        return (lambda content: self.result_cache.get(key(content)),
+                lambda content, result: self.result_cache.put(key(content), result))
+
+    def _humanize_batch(self, contents, messiness, synonym_freq, clean_mode, seed=None, docs_out=None, seeds=None):
+        """
+        Run the pipeline over several paragraphs with one batched POS-tagging call.
+
+        `seeds` optionally gives each paragraph its own seed instead of `seed`.
+        If a `docs_out` list is given, the finished Documents (with their
+        changed spans and edit logs) are appended to it.
+        """
+        if contents:
+            download_nltk_resources()
+        if seeds is None:
+            seeds = [seed] * len(contents)
+        docs = [Document(content) for content in contents]
+        rngs = [self._paragraph_rng(content, paragraph_seed) for content, paragraph_seed in zip(contents, seeds)]
+
+        candidates = [self._humanize_structure(doc, messiness, synonym_freq, clean_mode, rng)
+                      for doc, rng in zip(docs, rngs)]
+        # Only sentences with a replacement candidate are tagged
+        tag_sentences(sentence for doc_candidates in candidates for sentence, _ in doc_candidates)
+
+        results = [self._humanize_finish(doc, doc_candidates, messiness, clean_mode, rng)
+                   for doc, doc_candidates, rng in zip(docs, candidates, rngs)]
+        if docs_out is not None:
+            docs_out.extend(docs)
+        return results
+
+    def _collect_edits(self, lines, split_lines, docs):
+        """One EditLog for the whole text, shifting each paragraph's edits to its offset in the input."""
+        edits = EditLog()
+        docs = iter(docs)
+        offset = 0
+        for line, (leading, content, _) in zip(lines, split_lines):
+            if content is not None:
+                edits.extend(next(docs).edits, offset + len(leading))
+            offset += len(line)
+        return edits
+
+    def _join_lines(self, split_lines, humanized):
+        """Reassemble lines from _split_line parts, taking each content from `humanized`."""
+        return "".join(leading if content is None else f"{leading}{next(humanized)}{trailing}"
+                       for leading, content, trailing in split_lines)
+
+    def _get_pool(self, workers):
+        if self._pool is None or self._pool_workers != workers:
+            # close() also saves a persistent synonym cache, so the new workers load it warm
+            self.close()
+            # multiprocessing is only imported once parallel mode is actually used
+            from humanizer_parallel import create_pool
+            self._pool = create_pool(self, workers, preload=self.preload)
+            self._pool_workers = workers
+        return self._pool
+
+    def worker_memory(self):
+        """Memory usage (RSS, shared, private bytes) of each worker process, if a pool is running."""
+        if self._pool is None:
+            return []
+        from humanizer_parallel import worker_memory
+        return worker_memory(self._pool, self._pool_workers)
+
+    def _worker_config(self):
+        """Constructor arguments that rebuild an equivalent humanizer in a worker process."""
+        return {
+            "synonym_table": self.synonym_table.path if self.synonym_table is not None else None,
+            "synonym_cache_path": self.synonym_cache.path,
+        }
+
+    def warmup(self):
+        """Load the sentence tokenizer, POS tagger and WordNet now rather than on the first request."""
+        download_nltk_resources()
+        tag_documents([Document("Warming up the models. This is a short sentence.")])
+        if self.synonym_table is None:
+            from nltk.corpus import wordnet
+            wordnet.ensure_loaded()
+        return self
+
+    def close(self):
+        """Shut down the worker pool, if one was started, and save the synonym cache if it has a path."""
+        if self.synonym_cache.path:
+            self.synonym_cache.save()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_workers = None
+
+    def _paragraph_rng(self, content, seed=None):
+        """A private RNG for one paragraph; seeded runs depend only on (seed, paragraph text)."""
+        return random.Random(None if seed is None else f"{seed}:{content}")
+
+    def _split_line(self, line):
+        """Split one line into (leading, content, trailing); content is None for blank lines."""
+        if not line.strip():
+            return line, None, ""
+        # Extract leading and trailing whitespace from this line
+        # This captures indentation and the newline at the end
+        return re.match(r'^(\s*)(.*?)(\s*)$', line, re.DOTALL).groups()
 
     def _cleanup_text(self, text):
         """Clean up common issues."""
@@ -591,6 +1012,7 @@ class NLPHumanizer:
         text = re.sub(r'\s+([.,!?;:])', r'\1', text)
         
         # Ensure sentences start with capital letter
+        import nltk
         sentences = nltk.sent_tokenize(text)
         cleaned = []
         for sent in sentences:
@@ -600,85 +1022,169 @@ class NLPHumanizer:
         
         return ' '.join(cleaned)
 
-    def _humanize_internal(self, text, messiness=0.3, synonym_freq=0.3, clean_mode=True):
+    def _humanize_internal(self, text, messiness=0.3, synonym_freq=0.3, clean_mode=True, rng=None):
         """Core humanization filter logic."""
-        
+        # Every stochastic choice comes from this per-call RNG, never the global one
+        rng = rng or random.Random()
+        download_nltk_resources()
+        # Segment once; every stage below edits this document in place
+        doc = Document(text)
+        candidates = self._humanize_structure(doc, messiness, synonym_freq, clean_mode, rng)
+        tag_sentences(sentence for sentence, _ in candidates)
+        return self._humanize_finish(doc, candidates, messiness, clean_mode, rng)
+
+    def _humanize_structure(self, doc, messiness=0.3, synonym_freq=0.3, clean_mode=True, rng=random):
+        """
+        Stages that run before POS tagging (phrases and sentence restructuring).
+
+        Returns the vocabulary candidates (see _vocabulary_candidates); only
+        their sentences need tagging before _humanize_finish.
+        """
         # 1. AI Phrase Replacement
-        text = self._replace_phrases(text) 
-        
-        # 2. De-Flower (Remove poetic junk)
-        text = self._remove_flowery_language(text)
+        # 2. De-Flower (Remove poetic junk) - same pass as the phrases
+        self._replace_phrases(doc, rng) 
 
         # 3. Clause Reordering & Restructuring
-        if random.random() < messiness:
-            text = self._reorder_clauses(text)
-            text = self._restructure_sentences(text)
+        if rng.random() < messiness:
+            self._reorder_clauses(doc)
+            self._restructure_sentences(doc)
 
-        # 4. Vocabulary Simplification (POS Aware)
+        # 4. Vocabulary Simplification (POS Aware) - pick the candidates before tagging
         # Low frequency for clean mode to keep it natural
         actual_freq = min(synonym_freq, 0.3) if clean_mode else synonym_freq
-        text = self.simplify_vocabulary(text, frequency=actual_freq)
+        return self._vocabulary_candidates(doc, frequency=actual_freq, rng=rng)
+
+    def _humanize_finish(self, doc, candidates, messiness=0.3, clean_mode=True, rng=random):
+        """Stages from vocabulary simplification onwards; returns the rendered paragraph."""
+        # 4. Vocabulary Simplification - replace the picked candidates
+        self._apply_vocabulary(doc, candidates, rng)
         
         # 5. Burstiness
-        text = self._apply_burstiness(text)
+        self._apply_burstiness(doc, rng)
 
 
         # 7. Structure Breaking (Participles)
-        text = self._break_participles(text)
+        self._break_participles(doc, rng)
 
         # 8. Contractions - ONLY IF NOT CLEAN MODE
         if not clean_mode:
-            text = self.enforce_contractions(text)
-            text = self._informal_contractions(text)
+            self._enforce_contractions(doc, informal=True, rng=rng)
             
             # 9. Structure Breaking
-            if random.random() < messiness:
-                text = self._fragment_sentences(text)
+            if rng.random() < messiness:
+                self._fragment_sentences(doc, rng)
             
             # 10. Noise Injection
             noise_level = 0.1 + (messiness * 0.3)
-            text = self.inject_noise(text, frequency=noise_level)
+            self._inject_noise(doc, frequency=noise_level, rng=rng)
             
             # 11. Imperfections
-            if random.random() < messiness:
-                text = self._add_imperfections(text)
+            if rng.random() < messiness:
+                self._add_imperfections(doc, rng)
         
         # 12. Cleanup spacing (ONLY within this chunk/paragraph)
-        text = re.sub(r'\s+([?.!,"])', r'\1', text)
-        text = re.sub(r' +', ' ', text).strip() # Only collapse horizontal spaces
+        doc.edits.stage = "cleanup"
+        for sent in doc:
+            cleaned = re.sub(r'\s+([?.!,"])', r'\1', sent.text)
+            sent.rewrite(re.sub(r' +', ' ', cleaned).strip(), rule="spacing") # Only collapse horizontal spaces
         
-        return text
+        return doc.render()
 
-    def get_highlighted_diff(self, original, humanized):
+    def get_highlighted_diff(self, original, humanized, inline_style=True):
         """
         Compare original and humanized text and return HTML with additions highlighted.
+
+        Consecutive changed tokens share one span. With inline_style=False the
+        spans carry only the `humanized-highlight` class (for pages that define it).
+        """
+        original_lines = original.splitlines(keepends=True)
+        humanized_lines = humanized.splitlines(keepends=True)
+        if len(original_lines) != len(humanized_lines):
+            return f'<div style="font-family: inherit;">{self._diff_fragment(original, humanized, inline_style)}</div>'
+        # humanize keeps the line structure, so diffing line by line keeps the cost linear in the line count
+        fragments = (self._diff_fragment(orig_line, hum_line, inline_style)
+                     for orig_line, hum_line in zip(original_lines, humanized_lines))
+        return f'<div style="font-family: inherit;">{"".join(fragments)}</div>'
+
+    def _paragraph_fragment(self, original, humanized, changes=None, inline_style=True):
+        """Highlighted HTML for one paragraph: from its changed spans if known, otherwise by diffing."""
+        if changes is None:
+            return self._diff_fragment(original, humanized, inline_style)
+        return self._highlight_fragment(humanized, changes, inline_style)
+
+    def _highlight_fragment(self, text, changes, inline_style=True):
+        """Highlighted HTML for `text` given the sorted (start, end) spans that were rewritten, in one pass."""
+        def tokens():
+            spans = iter(changes)
+            change = next(spans, None)
+            for match in DIFF_TOKEN.finditer(text):
+                while change is not None and change[1] <= match.start():
+                    change = next(spans, None)
+                yield match.group(), change is not None and change[0] < match.end()
+
+        return self._render_highlight(tokens(), inline_style)
+
+    def _render_highlight(self, tokens, inline_style=True):
         """
+        HTML for (token, changed) pairs.
+
+        A run of changed tokens, with the whitespace between them, shares one
+        span; whitespace around a run (or containing a line break) stays outside.
+        Token text is HTML-escaped.
+        """
+        # Using a global CSS class 'humanized-highlight' defined in app.py
+        # Fallback inline style just in case CSS doesn't load (left out when the caller has the CSS)
+        if inline_style:
+            open_tag = '<span class="humanized-highlight" style="background-color: #d4edda !important;">'
+        else:
+            open_tag = '<span class="humanized-highlight">'
+        html_output = []
+        run = []  # changed tokens of the open span
+        gap = []  # whitespace after the run, moved inside only if another changed token follows
+
+        def close_run():
+            if run:
+                html_output.append(f'{open_tag}{"".join(run)}</span>')
+                run.clear()
+            html_output.extend(space.replace('\n', '<br>') for space in gap)
+            gap.clear()
+
+        for token, changed in tokens:
+            if not token.strip():
+                if run and '\n' not in token:
+                    gap.append(token)
+                else:
+                    close_run()
+                    html_output.append(token.replace('\n', '<br>'))
+            elif changed:
+                run.extend(gap)
+                gap.clear()
+                run.append(html.escape(token, quote=False))
+            else:
+                close_run()
+                html_output.append(html.escape(token, quote=False))
+        close_run()
+        return "".join(html_output)
+
+    def _diff_fragment(self, original, humanized, inline_style=True):
+        """Highlighted HTML for `humanized` without the wrapping <div> (so pieces can be joined)."""
         import difflib
         
         # Split by words but preserve whitespace for better diffing
         def tokenize(text):
-            return re.findall(r'\w+|[^\w\s]|\s+', text)
+            return DIFF_TOKEN.findall(text)
 
         orig_tokens = tokenize(original)
         hum_tokens = tokenize(humanized)
         
         matcher = difflib.SequenceMatcher(None, orig_tokens, hum_tokens)
-        html_output = []
-        
-        # Using a global CSS class 'humanized-highlight' defined in app.py
-        # Fallback inline style just in case CSS doesn't load
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag == 'equal':
-                for i in range(j1, j2):
-                    token = hum_tokens[i]
-                    html_output.append(token.replace('\n', '<br>'))
-            elif tag in ('insert', 'replace'):
-                for i in range(j1, j2):
-                    token = hum_tokens[i]
-                    if token.strip():
-                        # We use class for main styling but add background inline as a fallback
-                        html_output.append(f'<span class="humanized-highlight" style="background-color: #d4edda !important;">{token}</span>')
-                    else:
-                        html_output.append(token.replace('\n', '<br>'))
-            
-        return f'<div style="font-family: inherit;">{"".join(html_output)}</div>'
+        tokens = ((hum_tokens[i], tag != 'equal')
+                  for tag, i1, i2, j1, j2 in matcher.get_opcodes() for i in range(j1, j2))
+        return self._render_highlight(tokens, inline_style)
+
+
+if __name__ == "__main__":
+    import sys
+    from humanizer_cli import main
+
+    sys.exit(main())